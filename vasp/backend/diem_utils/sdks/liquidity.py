@@ -4,8 +4,11 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import os
+import threading
+import time
+from concurrent.futures import Future
 from http import HTTPStatus
-from typing import Optional, List
+from typing import Callable, Dict, Hashable, List, Optional, Tuple, TypeVar
 from urllib.parse import urljoin
 from uuid import UUID
 
@@ -13,7 +16,7 @@ import requests
 
 from diem_utils.types.liquidity.currency import CurrencyPair
 from diem_utils.types.liquidity.lp import LPDetails
-from diem_utils.types.liquidity.quote import QuoteData, QuoteId
+from diem_utils.types.liquidity.quote import QuoteData, QuoteId, Rate
 from diem_utils.types.liquidity.settlement import DebtData
 from diem_utils.types.liquidity.trade import TradeId, Direction, TradeData
 
@@ -25,13 +28,17 @@ class LpClient:
         if base_url:
             self._base_url = base_url
 
-    def get_quote(self, pair: CurrencyPair, amount: int) -> QuoteData:
+    def get_quote(
+        self, pair: CurrencyPair, amount: int, timeout: Optional[float] = None
+    ) -> QuoteData:
         data = {
             "base_currency": pair.base.value,
             "quote_currency": pair.quote.value,
             "amount": amount,
         }
-        response = requests.post(url=urljoin(self._base_url, "quote"), json=data)
+        response = requests.post(
+            url=urljoin(self._base_url, "quote"), json=data, timeout=timeout
+        )
         raise_if_failed(response, f"Failed to get quote for {data}")
 
         return QuoteData.from_json(response.text)
@@ -90,6 +97,86 @@ class LpClient:
                                   f"confirmation {settlement_confirmation}")
 
 
+T = TypeVar("T")
+
+
+class CachingLpClient(LpClient):
+    """
+    LpClient reusing the answers of the liquidity provider where it safely can,
+    for use as one instance per process.
+    get_rate serves the rate of the last quote for a currency pair until
+    expiry_margin_s before that quote expires, and lp_details are kept for
+    details_ttl_s. Concurrent callers asking for the same thing share a
+    single request. get_quote itself is not cached: a quote is traded once.
+    """
+
+    def __init__(
+        self,
+        base_url=None,
+        expiry_margin_s: float = 5.0,
+        details_ttl_s: float = 300.0,
+        clock: Callable[[], float] = time.time,
+    ):
+        super().__init__(base_url)
+        self.expiry_margin_s = expiry_margin_s
+        self.details_ttl_s = details_ttl_s
+        self.clock = clock
+
+        self._lock = threading.Lock()
+        self._rates: Dict[Tuple[str, str], Tuple[Rate, float]] = {}
+        self._details: Optional[Tuple[LPDetails, float]] = None
+        self._in_flight: Dict[Hashable, Future] = {}
+
+    def get_rate(
+        self, pair: CurrencyPair, amount: int, timeout: Optional[float] = None
+    ) -> Rate:
+        key = (pair.base.value, pair.quote.value)
+        cached = self._rates.get(key)
+        if cached is not None and self.clock() < cached[1]:
+            return cached[0]
+
+        def load() -> Rate:
+            quote = self.get_quote(pair, amount, timeout=timeout)
+            valid_until = quote.expires_at.timestamp() - self.expiry_margin_s
+            self._rates[key] = (quote.rate, valid_until)
+            return quote.rate
+
+        return self._shared(("rate", key), load)
+
+    def lp_details(self) -> LPDetails:
+        cached = self._details
+        if cached is not None and self.clock() < cached[1]:
+            return cached[0]
+
+        def load() -> LPDetails:
+            details = super(CachingLpClient, self).lp_details()
+            self._details = (details, self.clock() + self.details_ttl_s)
+            return details
+
+        return self._shared("details", load)
+
+    def _shared(self, key: Hashable, load: Callable[[], T]) -> T:
+        """Run load, or wait for the result of a caller already running it"""
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = Future()
+        if not leader:
+            return future.result()
+
+        try:
+            result = load()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+
 def raise_if_failed(response, error_description):
     if response.status_code < 200 or response.status_code >= 300:
         raise LpError(f"{error_description} ({response.status_code})")
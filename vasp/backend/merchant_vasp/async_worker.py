@@ -0,0 +1,241 @@
+# Copyright (c) The Diem Core Contributors
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Asyncio worker for the payment queues, run with `python -m merchant_vasp.async_worker`.
+
+Instead of one worker thread per message, a single event loop keeps up to
+max_in_flight messages per queue in flight and hands the blocking work to a
+small thread pool sized for the database. Messages for process_incoming_txn
+that arrive close together are cleared as one batch, with one payment lookup
+and one commit, so a burst of payments does not cost a transaction each.
+Message handling (middleware, retries, acks) is the same as for `dramatiq`.
+"""
+
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import signal
+from concurrent.futures import Executor, ThreadPoolExecutor
+from queue import Empty
+from typing import List, Optional, Set
+
+import dramatiq
+from dramatiq import Worker
+from dramatiq.broker import MessageProxy
+from dramatiq.middleware import SkipMessage
+
+from .background_tasks import process_incoming_txn
+from .background_tasks.background import _incoming_transaction_args
+from .metrics import WorkerMetrics
+from .payment_service import process_incoming_transactions
+from .storage import db_session
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncWorker:
+    def __init__(
+        self,
+        broker: dramatiq.Broker,
+        queues: Optional[List[str]] = None,
+        max_in_flight: int = 200,
+        threads: int = 4,
+        batch_size: int = 50,
+        batch_window_ms: int = 20,
+        executor: Optional[Executor] = None,
+    ) -> None:
+        self.broker = broker
+        self.threads = threads
+        self.batch_size = batch_size
+        self.batch_window_ms = batch_window_ms
+
+        # The dramatiq worker only runs its consumers here, which prefetch up
+        # to max_in_flight unacked messages per queue onto its work queue
+        self.worker = Worker(broker, queues=queues, worker_threads=0)
+        self.worker.queue_prefetch = max_in_flight
+        self.worker.delay_prefetch = max_in_flight * 10
+
+        self.executor = executor or ThreadPoolExecutor(
+            max_workers=threads, thread_name_prefix="async-worker"
+        )
+        self.running = False
+        self.tasks: Set[asyncio.Future] = set()
+        self.txn_messages: List[MessageProxy] = []
+        self.flush_handle: Optional[asyncio.TimerHandle] = None
+
+    async def run(self) -> None:
+        loop = asyncio.get_event_loop()
+        self.running = True
+        self.worker.start()
+        for middleware in self.broker.middleware:
+            if isinstance(middleware, WorkerMetrics):
+                middleware.threads.set(self.threads)
+        logger.info(f"Async worker started with {self.threads} threads")
+        try:
+            while self.running:
+                message = await loop.run_in_executor(None, self._next_message)
+                if message is None:
+                    continue
+                if message.actor_name == process_incoming_txn.actor_name:
+                    self._add_txn_message(message)
+                else:
+                    self._spawn(self._process_message, message)
+        finally:
+            self._flush_txn_messages()
+            if self.tasks:
+                await asyncio.wait(self.tasks)
+            self.worker.stop()
+            self.executor.shutdown()
+
+    def stop(self) -> None:
+        self.running = False
+
+    def _next_message(self) -> Optional[MessageProxy]:
+        try:
+            _, message = self.worker.work_queue.get(
+                timeout=self.worker.worker_timeout / 1000
+            )
+            return message
+        except Empty:
+            return None
+
+    def _spawn(self, fn, *args) -> None:
+        loop = asyncio.get_event_loop()
+        task = asyncio.ensure_future(loop.run_in_executor(self.executor, fn, *args))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    def _add_txn_message(self, message: MessageProxy) -> None:
+        self.txn_messages.append(message)
+        if len(self.txn_messages) >= self.batch_size:
+            self._flush_txn_messages()
+        elif self.flush_handle is None:
+            self.flush_handle = asyncio.get_event_loop().call_later(
+                self.batch_window_ms / 1000, self._flush_txn_messages
+            )
+
+    def _flush_txn_messages(self) -> None:
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        if self.txn_messages:
+            self._spawn(self._process_txn_messages, self.txn_messages)
+            self.txn_messages = []
+
+    def _process_message(self, message: MessageProxy) -> None:
+        """Same as a dramatiq worker thread processing a message"""
+        try:
+            self.broker.emit_before("process_message", message)
+            result = None
+            if not message.failed:
+                actor = self.broker.get_actor(message.actor_name)
+                result = actor(*message.args, **message.kwargs)
+            self.broker.emit_after("process_message", message, result=result)
+        except SkipMessage:
+            self.broker.emit_after("skip_message", message)
+        except BaseException as e:
+            self._fail(message, e)
+        finally:
+            self._post_process(message)
+
+    def _process_txn_messages(self, messages: List[MessageProxy]) -> None:
+        """Clear the events of many process_incoming_txn messages as one batch"""
+        batch = []
+        transactions = []
+        for message in messages:
+            try:
+                self.broker.emit_before("process_message", message)
+                if message.failed:
+                    self.broker.emit_after("process_message", message, result=None)
+                    self._post_process(message)
+                    continue
+                transactions.append(_incoming_transaction_args(*message.args))
+                batch.append(message)
+            except SkipMessage:
+                self.broker.emit_after("skip_message", message)
+                self._post_process(message)
+            except BaseException as e:
+                self._fail(message, e)
+                self._post_process(message)
+
+        try:
+            results = process_incoming_transactions(transactions)
+        except Exception as e:
+            results = [e] * len(batch)
+        finally:
+            db_session.remove()
+
+        for message, result in zip(batch, results):
+            # Like process_incoming_txn, rejected payments fail the message
+            # for good and transient errors retry it
+            if result is None:
+                self.broker.emit_after("process_message", message, result=None)
+            else:
+                self._fail(message, result)
+            self._post_process(message)
+
+    def _fail(self, message: MessageProxy, exc: BaseException) -> None:
+        logger.error(f"Failed to process message {message}: {exc!r}")
+        message.stuff_exception(exc)
+        self.broker.emit_after("process_message", message, exception=exc)
+
+    def _post_process(self, message: MessageProxy) -> None:
+        self.worker.consumers[message.queue_name].post_process_message(message)
+        self.worker.work_queue.task_done()
+        message.clear_exception()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Asyncio payment worker")
+    parser.add_argument(
+        "--queues", nargs="*", help="queues to consume, all declared queues if unset"
+    )
+    parser.add_argument(
+        "--max-in-flight",
+        type=int,
+        default=200,
+        help="unacked messages held per queue",
+    )
+    parser.add_argument(
+        "--threads", type=int, default=4, help="threads running database work"
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=50,
+        help="max incoming payments cleared in one transaction",
+    )
+    parser.add_argument(
+        "--batch-window-ms",
+        type=int,
+        default=20,
+        help="how long to wait for more incoming payments to batch",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    broker = dramatiq.get_broker()
+    broker.emit_after("process_boot")
+    # Like the dramatiq command, run the middleware's own processes, i.e. the
+    # metrics exposition server
+    for fork in [fork for middleware in broker.middleware for fork in middleware.forks]:
+        multiprocessing.Process(target=fork, daemon=True).start()
+
+    async_worker = AsyncWorker(
+        broker,
+        queues=args.queues,
+        max_in_flight=args.max_in_flight,
+        threads=args.threads,
+        batch_size=args.batch_size,
+        batch_window_ms=args.batch_window_ms,
+    )
+    loop = asyncio.get_event_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, async_worker.stop)
+    loop.run_until_complete(async_worker.run())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,47 +1,111 @@
+import logging
+import zlib
+from typing import Any, Dict, List, Optional
+
 import dramatiq
-from diem import diem_types
 from diem_utils.types.currencies import DiemCurrency
 
 from pubsub.types import LRWPubSubEvent
-from ..payment_service import process_incoming_transaction, PaymentServiceException
+from ..config import PAYMENT_QUEUE_PARTITIONS
+from ..dead_letters import dead_letter, is_transient, MIN_BACKOFF_MS
+from ..payment_service import (
+    process_incoming_transaction,
+    process_incoming_transactions,
+    PaymentServiceException,
+)
 from ..storage import db_session
 
+logger = logging.getLogger(__name__)
 
-@dramatiq.actor(store_results=True)
-def process_incoming_txn(txn: LRWPubSubEvent) -> None:
-    metadata = txn.metadata
 
-    sender_sub_address = None
-    receiver_sub_address = None
+def payment_queue_name(sub_address: Optional[str]) -> Optional[str]:
+    """
+    Queue for events paying to the given subaddress, or None to use the
+    actor's own queue. With more than one partition, all events of a payment
+    land on the same queue, so a worker bound to it sees them in order.
+    """
+    if PAYMENT_QUEUE_PARTITIONS <= 1:
+        return None
+    partition = zlib.crc32((sub_address or "").encode()) % PAYMENT_QUEUE_PARTITIONS
+    return f"incoming_txn_{partition}"
 
-    if (
-        metadata
-        and isinstance(metadata, diem_types.Metadata__GeneralMetadata)
-        and isinstance(
-            metadata.value, diem_types.GeneralMetadata__GeneralMetadataVersion0
-        )
-    ):
-        general_metadata = metadata.value.value
 
-        if general_metadata.to_subaddress:
-            receiver_sub_address = general_metadata.to_subaddress.hex()
+if PAYMENT_QUEUE_PARTITIONS > 1:
+    for partition in range(PAYMENT_QUEUE_PARTITIONS):
+        dramatiq.get_broker().declare_queue(f"incoming_txn_{partition}")
 
-        if general_metadata.from_subaddress:
-            sender_sub_address = general_metadata.from_subaddress.hex()
 
+@dramatiq.actor(store_results=True, throws=(PaymentServiceException,))
+def process_incoming_txn(txn: LRWPubSubEvent) -> None:
     try:
-        process_incoming_transaction(
-            version=txn.version,
-            sender_address=txn.sender,
-            sender_sub_address=sender_sub_address,
-            receiver_address=txn.receiver,
-            receiver_sub_address=receiver_sub_address,
-            amount=txn.amount,
-            currency=DiemCurrency[txn.currency],
-        )
-    except PaymentServiceException as _:
-        # TODO - log exception
+        process_incoming_transaction(**_incoming_transaction_args(txn))
+    except PaymentServiceException:
+        # Rejected payments are not retried; failing the message dead letters it
         db_session.rollback()
+        raise
+    finally:
+        db_session.remove()
+
 
+@dramatiq.actor
+def process_incoming_txn_batch(txns: List[LRWPubSubEvent]) -> None:
+    """
+    Same as process_incoming_txn for a batch of events, cleared with one
+    payment lookup and one commit. Failed events do not fail the batch: they
+    are sent again on their own if the failure is transient, and dead
+    lettered as process_incoming_txn messages otherwise.
+    """
+    batch = []
+    transactions = []
+    for txn in txns:
+        try:
+            transactions.append(_incoming_transaction_args(txn))
+            batch.append(txn)
+        except KeyError as e:
+            dead_letter(_txn_message(txn), f"Unknown currency {e}")
+
+    try:
+        results = process_incoming_transactions(transactions)
     finally:
         db_session.remove()
+
+    for txn, result in zip(batch, results):
+        if result is None:
+            continue
+        if is_transient(result):
+            process_incoming_txn.broker.enqueue(_txn_message(txn), delay=MIN_BACKOFF_MS)
+        else:
+            dead_letter(_txn_message(txn), repr(result))
+
+
+def _txn_message(txn: LRWPubSubEvent) -> dramatiq.Message:
+    """A process_incoming_txn message for the event, on its payment queue"""
+    message = process_incoming_txn.message(txn)
+    queue_name = payment_queue_name(txn.receiver_sub_address)
+    return message.copy(queue_name=queue_name) if queue_name else message
+
+
+def _incoming_transaction_args(txn: LRWPubSubEvent) -> Dict[str, Any]:
+    return dict(
+        version=txn.version,
+        sender_address=txn.sender,
+        sender_sub_address=txn.sender_sub_address,
+        receiver_address=txn.receiver,
+        receiver_sub_address=txn.receiver_sub_address,
+        amount=txn.amount,
+        currency=DiemCurrency[txn.currency],
+    )
+
+
+@dramatiq.actor(queue_name="unmatched_txn")
+def record_unmatched_txn(txn: LRWPubSubEvent) -> None:
+    """
+    Keep events pubsub found no open payment for, e.g. late payments or ones
+    to a mistyped subaddress. They are dead lettered as process_incoming_txn
+    messages, so they can be looked into and re-driven to the payment path.
+    """
+    logger.warning(f"Incoming transaction matches no open payment: {txn}")
+    dead_letter(
+        _txn_message(txn),
+        f"No open payment for subaddress {txn.receiver_sub_address}",
+    )
@@ -0,0 +1,83 @@
+# Copyright (c) The Diem Core Contributors
+# SPDX-License-Identifier: Apache-2.0
+
+import logging
+import threading
+import time
+from typing import Callable, Generic, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_MISSING = object()
+
+
+class CachedValue(Generic[T]):
+    """
+    A value loaded on first use and fresh for ttl_s seconds. A stale value is
+    still returned right away while a background thread loads a new one
+    (stale-while-revalidate), so callers only wait for the very first load.
+    If a refresh fails, the last good value keeps being served and the
+    refresh is tried again after retry_interval_s.
+    """
+
+    def __init__(
+        self,
+        load: Callable[[], T],
+        ttl_s: float,
+        retry_interval_s: float = 5.0,
+        name: Optional[str] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.load = load
+        self.ttl_s = ttl_s
+        self.retry_interval_s = retry_interval_s
+        self.name = name or getattr(load, "__name__", "value")
+        self.clock = clock
+
+        self._lock = threading.Lock()
+        self._value = _MISSING
+        self._refresh_at = 0.0
+        self._refresh_thread: Optional[threading.Thread] = None
+
+    def get(self) -> T:
+        with self._lock:
+            if self._value is _MISSING:
+                # Concurrent first callers wait for one load instead of each
+                # running their own; a failure is raised to all of them
+                self._store(self.load())
+            elif self.clock() >= self._refresh_at and not self._refreshing():
+                self._refresh_thread = threading.Thread(
+                    target=self._refresh, name=f"refresh-{self.name}", daemon=True
+                )
+                self._refresh_thread.start()
+            return self._value
+
+    def invalidate(self) -> None:
+        """Drop the value, so the next call loads it again"""
+        with self._lock:
+            self._value = _MISSING
+
+    def wait_for_refresh(self, timeout: Optional[float] = None) -> None:
+        thread = self._refresh_thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def _refreshing(self) -> bool:
+        return self._refresh_thread is not None and self._refresh_thread.is_alive()
+
+    def _refresh(self) -> None:
+        try:
+            value = self.load()
+        except Exception as e:
+            logger.warning(f"Refreshing {self.name} failed, serving stale value: {e!r}")
+            with self._lock:
+                self._refresh_at = self.clock() + self.retry_interval_s
+            return
+        with self._lock:
+            self._store(value)
+
+    def _store(self, value: T) -> None:
+        self._value = value
+        self._refresh_at = self.clock() + self.ttl_s
@@ -4,14 +4,48 @@ import dramatiq
 import redis
 from dramatiq.brokers.redis import RedisBroker, Broker
 from dramatiq.encoder import PickleEncoder
+from dramatiq.middleware import Prometheus, Retries
 from dramatiq.results import Results
 from dramatiq.results.backends.redis import RedisBackend
 from diem import identifier
 
+from .dead_letters import (
+    DeadLetters,
+    DeadLetterStore,
+    retry_when,
+    MIN_BACKOFF_MS,
+    MAX_BACKOFF_MS,
+)
+from .expiry_reaper import ExpiryReaper
+from .metrics import WorkerMetrics
+
 DB_URL: str = os.getenv("DB_URL", "sqlite:////tmp/merchant_test.db")
 
 PAYMENT_EXPIRE_MINUTES = 10
 
+# Quotes for the payment options of a new payment are fetched concurrently:
+# each may take up to QUOTE_TIMEOUT_S, and all of them up to QUOTE_DEADLINE_S
+QUOTE_TIMEOUT_S: float = float(os.getenv("QUOTE_TIMEOUT_S", 2))
+QUOTE_DEADLINE_S: float = float(os.getenv("QUOTE_DEADLINE_S", 3))
+# Quote rates are reused until this long before their quote expires, and the
+# liquidity provider's details for LP_DETAILS_TTL_S
+QUOTE_EXPIRY_MARGIN_S: float = float(os.getenv("QUOTE_EXPIRY_MARGIN_S", 5))
+LP_DETAILS_TTL_S: float = float(os.getenv("LP_DETAILS_TTL_S", 300))
+
+# How often expired payments are rejected, and how many per transaction
+EXPIRY_REAPER_INTERVAL_S: int = int(os.getenv("EXPIRY_REAPER_INTERVAL_S", 60))
+EXPIRY_REAPER_BATCH_SIZE: int = int(os.getenv("EXPIRY_REAPER_BATCH_SIZE", 500))
+
+# How long the currencies of the network are cached before being refreshed
+NETWORK_CURRENCIES_TTL_S: int = int(os.getenv("NETWORK_CURRENCIES_TTL_S", 300))
+
+QR_SCALE = 10
+# Rendered QR code images kept in memory, per process
+QR_CACHE_SIZE: int = int(os.getenv("QR_CACHE_SIZE", 1024))
+
+# Incoming payments are routed to this many queues by receiver subaddress
+PAYMENT_QUEUE_PARTITIONS: int = int(os.getenv("PAYMENT_QUEUE_PARTITIONS", 1))
+
 REDIS_HOST: str = os.getenv("REDIS_HOST", "localhost")
 REDIS_PORT: int = int(os.getenv("REDIS_PORT", 6379))
 REDIS_PASSWORD: str = os.getenv("REDIS_PASSWORD", "")
@@ -29,9 +63,22 @@ def setup_redis_broker() -> None:
     _redis_db: redis.StrictRedis = redis.StrictRedis(connection_pool=_connection_pool)
     _result_backend = RedisBackend(encoder=PickleEncoder(), client=_redis_db)
     _result_middleware = Results(backend=_result_backend)
+    # After-hooks run in reverse order, so Retries decides whether a message
+    # failed for good before the others see it
+    _retries_middleware = Retries(
+        min_backoff=MIN_BACKOFF_MS, max_backoff=MAX_BACKOFF_MS, retry_when=retry_when
+    )
+    _dead_letters_middleware = DeadLetters(DeadLetterStore(_redis_db))
     broker: Broker = RedisBroker(
         connection_pool=_connection_pool,
-        middleware=[_result_middleware],
+        middleware=[
+            Prometheus(),
+            WorkerMetrics(),
+            ExpiryReaper(EXPIRY_REAPER_INTERVAL_S, EXPIRY_REAPER_BATCH_SIZE),
+            _result_middleware,
+            _dead_letters_middleware,
+            _retries_middleware,
+        ],
         namespace="lrm",
     )
     dramatiq.set_broker(broker)
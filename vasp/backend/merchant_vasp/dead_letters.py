@@ -0,0 +1,252 @@
+# Copyright (c) The Diem Core Contributors
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Retry policy and dead letters for the background tasks.
+
+Transient failures (a dropped database connection, an unreachable full node,
+Redis going away) are retried with exponential backoff. The retries wait on
+the delay queue, so they do not hold a worker thread while backing off.
+Anything else fails the message right away, and failed messages are kept in
+a Redis hash with no expiry until someone looks at them.
+
+Inspect and re-drive them with `python -m merchant_vasp.dead_letters_cli`.
+"""
+
+import argparse
+import base64
+import json
+import logging
+import time
+import traceback
+from dataclasses import asdict, dataclass
+from typing import Iterable, List, Optional
+
+import dramatiq
+import redis
+import requests
+from diem import jsonrpc
+from dramatiq.common import q_name
+from dramatiq.middleware import Middleware
+from sqlalchemy import exc as sa_exc
+
+logger = logging.getLogger(__name__)
+
+DEAD_LETTERS_KEY = "lrm:dead_letters"
+
+MAX_TRANSIENT_RETRIES = 10
+MIN_BACKOFF_MS = 1000
+MAX_BACKOFF_MS = 5 * 60 * 1000
+
+TRANSIENT_ERRORS = (
+    dramatiq.Retry,
+    sa_exc.OperationalError,
+    sa_exc.DisconnectionError,
+    sa_exc.TimeoutError,
+    jsonrpc.NetworkError,
+    jsonrpc.StaleResponseError,
+    requests.ConnectionError,
+    requests.Timeout,
+    redis.ConnectionError,
+    redis.TimeoutError,
+)
+
+# Delivery options that belong to a failed attempt, dropped on re-drive
+_ATTEMPT_OPTIONS = ("retries", "traceback", "redis_message_id", "eta")
+
+
+def is_transient(exception: BaseException) -> bool:
+    if isinstance(exception, TRANSIENT_ERRORS):
+        return True
+    return isinstance(exception, sa_exc.DBAPIError) and bool(
+        exception.connection_invalidated
+    )
+
+
+def retry_when(retries: int, exception: BaseException) -> bool:
+    """Retry policy for the Retries middleware: transient errors only"""
+    return is_transient(exception) and retries < MAX_TRANSIENT_RETRIES
+
+
+@dataclass
+class DeadLetter:
+    message_id: str
+    actor_name: str
+    queue_name: str
+    reason: str
+    failed_at: float
+    retries: int
+    message: str  # base64 of the encoded dramatiq message
+    traceback: Optional[str] = None
+
+    def to_message(self) -> dramatiq.Message:
+        return dramatiq.Message.decode(base64.b64decode(self.message))
+
+
+class DeadLetterStore:
+    """
+    Failed messages in a Redis hash, one field per message id. Unlike the
+    broker's own dead letter queues, entries never expire.
+    """
+
+    def __init__(self, client: redis.StrictRedis, key: str = DEAD_LETTERS_KEY) -> None:
+        self.client = client
+        self.key = key
+
+    def add(
+        self,
+        message: dramatiq.Message,
+        reason: str,
+        traceback: Optional[str] = None,
+    ) -> DeadLetter:
+        dead_letter = DeadLetter(
+            message_id=message.message_id,
+            actor_name=message.actor_name,
+            queue_name=q_name(message.queue_name),
+            reason=reason,
+            failed_at=time.time(),
+            retries=message.options.get("retries", 0),
+            message=base64.b64encode(message.encode()).decode(),
+            traceback=traceback,
+        )
+        self.client.hset(
+            self.key, dead_letter.message_id, json.dumps(asdict(dead_letter))
+        )
+        return dead_letter
+
+    def get(self, message_id: str) -> Optional[DeadLetter]:
+        data = self.client.hget(self.key, message_id)
+        return DeadLetter(**json.loads(data)) if data else None
+
+    def list(self, actor_name: Optional[str] = None) -> List[DeadLetter]:
+        dead_letters = [
+            DeadLetter(**json.loads(data))
+            for data in self.client.hgetall(self.key).values()
+        ]
+        if actor_name is not None:
+            dead_letters = [d for d in dead_letters if d.actor_name == actor_name]
+        return sorted(dead_letters, key=lambda d: d.failed_at)
+
+    def count(self) -> int:
+        return self.client.hlen(self.key)
+
+    def delete(self, message_ids: Iterable[str]) -> int:
+        message_ids = list(message_ids)
+        return self.client.hdel(self.key, *message_ids) if message_ids else 0
+
+    def redrive(
+        self, broker: dramatiq.Broker, dead_letters: Iterable[DeadLetter]
+    ) -> int:
+        """
+        Send the messages again, as first attempts, to their original queues.
+        An entry is only removed once its message is back on the broker.
+        """
+        redriven = 0
+        for dead_letter in dead_letters:
+            message = dead_letter.to_message()
+            options = {
+                k: v for k, v in message.options.items() if k not in _ATTEMPT_OPTIONS
+            }
+            # Message.copy merges options, so replace them outright
+            broker.enqueue(
+                message._replace(queue_name=dead_letter.queue_name, options=options)
+            )
+            self.delete([dead_letter.message_id])
+            redriven += 1
+        return redriven
+
+
+class DeadLetters(Middleware):
+    """Keeps every message that failed for good, i.e. was not retried"""
+
+    def __init__(self, store: DeadLetterStore) -> None:
+        self.store = store
+
+    def after_process_message(
+        self, broker, message, *, result=None, exception=None
+    ) -> None:
+        if exception is None or not message.failed:
+            return
+        tb = "".join(
+            traceback.format_exception(
+                type(exception), exception, exception.__traceback__
+            )
+        )
+        self.store.add(message, repr(exception), tb)
+        logger.warning(f"Dead lettered message {message.message_id}: {exception!r}")
+
+
+def get_dead_letter_store(
+    broker: Optional[dramatiq.Broker] = None,
+) -> Optional[DeadLetterStore]:
+    broker = broker or dramatiq.get_broker()
+    for middleware in broker.middleware:
+        if isinstance(middleware, DeadLetters):
+            return middleware.store
+    return None
+
+
+def dead_letter(message: dramatiq.Message, reason: str) -> None:
+    """Keep a message that will not be processed, e.g. one event of a batch"""
+    store = get_dead_letter_store()
+    if store is None:
+        logger.error(f"No dead letter store, dropping {message}: {reason}")
+        return
+    store.add(message, reason)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Inspect and re-drive dead letters")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    list_parser = commands.add_parser("list", help="list dead letters, oldest first")
+    list_parser.add_argument("--actor", help="only messages for this actor")
+
+    show_parser = commands.add_parser("show", help="show a dead letter in full")
+    show_parser.add_argument("message_id")
+
+    for name, help_text in (
+        ("redrive", "send messages to their queues again"),
+        ("delete", "drop messages for good"),
+    ):
+        command_parser = commands.add_parser(name, help=help_text)
+        command_parser.add_argument("message_ids", nargs="*")
+        command_parser.add_argument(
+            "--all", action="store_true", help="every dead letter (of --actor)"
+        )
+        command_parser.add_argument("--actor", help="only messages for this actor")
+
+    args = parser.parse_args()
+
+    broker = dramatiq.get_broker()
+    store = get_dead_letter_store(broker)
+    if store is None:
+        parser.exit(1, "The broker keeps no dead letters\n")
+
+    if args.command == "list":
+        for d in store.list(args.actor):
+            failed_at = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(d.failed_at))
+            print(f"{d.message_id}  {failed_at}  {d.actor_name}  {d.reason}")
+        return
+
+    if args.command == "show":
+        dead_letter = store.get(args.message_id)
+        if dead_letter is None:
+            parser.exit(1, f"No dead letter {args.message_id}\n")
+        message = dead_letter.to_message()
+        print(json.dumps(asdict(dead_letter), indent=2, default=str))
+        print(f"args: {message.args!r}\nkwargs: {message.kwargs!r}")
+        return
+
+    if args.all:
+        selected = store.list(args.actor)
+    else:
+        selected = [store.get(message_id) for message_id in args.message_ids]
+        selected = [d for d in selected if d is not None]
+        if args.actor:
+            selected = [d for d in selected if d.actor_name == args.actor]
+
+    if args.command == "redrive":
+        print(f"Re-drove {store.redrive(broker, selected)} messages")
+    else:
+        print(f"Deleted {store.delete(d.message_id for d in selected)} messages")
@@ -0,0 +1,15 @@
+# Copyright (c) The Diem Core Contributors
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Inspect and re-drive dead letters, run with `python -m merchant_vasp.dead_letters_cli`.
+
+Kept apart from merchant_vasp.dead_letters, which the broker set up by the
+config already imports: running that module itself with -m would load a
+second copy of it, whose DeadLetters middleware the broker does not use.
+"""
+
+from merchant_vasp.dead_letters import main
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+# Copyright (c) The Diem Core Contributors
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Periodic rejection of expired payments.
+
+Created payments past their expiry date are otherwise only rejected when a
+late payment event happens to arrive for them. ExpiryReaper runs a thread in
+every worker process, which every interval_s tries to take that round's slot
+in Redis; the one process that gets it rejects the expired payments in
+bounded bulk batches, see payment_service.reject_expired_payments.
+"""
+
+import logging
+import threading
+
+import dramatiq
+from dramatiq.brokers.redis import RedisBroker
+from dramatiq.middleware import Middleware
+
+logger = logging.getLogger(__name__)
+
+REAPER_SLOT_KEY = "lrm:expiry_reaper"
+
+
+class ExpiryReaper(Middleware):
+    def __init__(self, interval_s: float = 60.0, batch_size: int = 500) -> None:
+        self.interval_s = interval_s
+        self.batch_size = batch_size
+        self.stop_reaping = threading.Event()
+
+    def after_worker_boot(self, broker: dramatiq.Broker, worker) -> None:
+        if isinstance(broker, RedisBroker):
+            self.stop_reaping.clear()
+            threading.Thread(
+                target=self._reap_forever, args=(broker,), daemon=True
+            ).start()
+
+    def before_worker_shutdown(self, broker: dramatiq.Broker, worker) -> None:
+        self.stop_reaping.set()
+
+    def reap(self, broker: RedisBroker) -> int:
+        """Reject expired payments, unless another process did this round"""
+        # The slot expires with the round, whichever process took it
+        if not broker.client.set(
+            REAPER_SLOT_KEY, 1, nx=True, px=int(self.interval_s * 1000)
+        ):
+            return 0
+
+        # Imported here, as the storage reads its settings from the config,
+        # which sets up this middleware
+        from .payment_service import reject_expired_payments
+        from .storage import db_session
+
+        try:
+            rejected = reject_expired_payments(self.batch_size)
+        finally:
+            db_session.remove()
+        if rejected:
+            logger.info(f"Rejected {rejected} expired payments")
+        return rejected
+
+    def _reap_forever(self, broker: RedisBroker) -> None:
+        while not self.stop_reaping.wait(self.interval_s):
+            try:
+                self.reap(broker)
+            except Exception as e:
+                logger.warning(f"Failed to reject expired payments: {e!r}")
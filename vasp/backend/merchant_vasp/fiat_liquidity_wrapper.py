@@ -5,41 +5,35 @@ from diem_utils.types.liquidity.trade import Direction
 from diem_utils.types.liquidity.currency import CurrencyPair, Currency
 from diem_utils.precise_amount import Amount
 
+from .config import LP_DETAILS_TTL_S, QUOTE_EXPIRY_MARGIN_S
+
 import logging
 
+# Shared by the whole process, so quote rates and LP details are reused
+lp_client = liquidity.CachingLpClient(
+    expiry_margin_s=QUOTE_EXPIRY_MARGIN_S, details_ttl_s=LP_DETAILS_TTL_S
+)
+
 
 class FiatLiquidityWrapper:
     def __init__(self, base_currency):
-        self.liquidity_provider = liquidity.LpClient()
+        self.liquidity_provider = lp_client
         self.base_currency = base_currency
 
-    def quote(self, quote_currency, amount):
-        if quote_currency == self.base_currency:
-            raise ValueError(
-                f"Unsupported quote: {self.base_currency} to {quote_currency}"
-            )
-
-        try:
-            # fiat currencies are always the second in pairs
-            currency_pair = CurrencyPair(
-                Currency(quote_currency), Currency(self.base_currency)
-            )
-            _ = CurrencyPairs.from_pair(currency_pair)
-        except KeyError:
-            logging.warning(
-                f"Could not get quote from {self.base_currency} to {quote_currency}"
-            )
+    def quote(self, quote_currency, amount, timeout=None):
+        currency_pair = self._quote_pair(quote_currency)
+        if currency_pair is None:
             return None
-        return self.liquidity_provider.get_quote(
-            currency_pair,
-            amount,
-        )
+        return self.liquidity_provider.get_quote(currency_pair, amount, timeout=timeout)
 
-    def quote_price(self, quote_currency, amount):
-        quote = self.quote(quote_currency, amount)
+    def quote_price(self, quote_currency, amount, timeout=None):
+        # Only the rate is needed, which holds until the quote expires
+        rate = self.liquidity_provider.get_rate(
+            self._quote_pair(quote_currency), amount, timeout=timeout
+        )
 
         unit = Amount().deserialize(Amount.unit)
-        rate = unit / Amount().deserialize(quote.rate.rate)
+        rate = unit / Amount().deserialize(rate.rate)
         return (rate * Amount().deserialize(amount)).serialize()
 
     def pay_out(self, target_currency, amount, diem_deposit_address):
@@ -58,3 +52,22 @@ class FiatLiquidityWrapper:
 
     def vasp_address(self):
         return self.liquidity_provider.lp_details().vasp
+
+    def _quote_pair(self, quote_currency):
+        if quote_currency == self.base_currency:
+            raise ValueError(
+                f"Unsupported quote: {self.base_currency} to {quote_currency}"
+            )
+
+        try:
+            # fiat currencies are always the second in pairs
+            currency_pair = CurrencyPair(
+                Currency(quote_currency), Currency(self.base_currency)
+            )
+            _ = CurrencyPairs.from_pair(currency_pair)
+        except KeyError:
+            logging.warning(
+                f"Could not get quote from {self.base_currency} to {quote_currency}"
+            )
+            return None
+        return currency_pair
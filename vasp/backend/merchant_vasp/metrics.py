@@ -0,0 +1,156 @@
+# Copyright (c) The Diem Core Contributors
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Prometheus metrics of the workers, for scaling them on backlog.
+
+dramatiq's Prometheus middleware exports per actor message counts and the
+dramatiq_message_duration_milliseconds latency histogram. WorkerMetrics adds:
+
+- lrm_queue_messages: messages waiting in each queue, ready or delayed
+- lrm_queue_oldest_message_age_seconds: how long the head of each queue
+  has been waiting
+- lrm_message_wait_seconds: per actor, time from enqueue (or from the end
+  of a retry backoff) to the start of processing
+- lrm_worker_threads and lrm_worker_busy_seconds_total, for the thread
+  busy ratio: sum(rate(lrm_worker_busy_seconds_total[1m])) / sum(lrm_worker_threads)
+
+Every worker process writes to dramatiq's multiprocess metrics directory,
+and all of them are served together on dramatiq_prom_port (9191 by default).
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Dict
+
+import dramatiq
+from dramatiq.brokers.redis import RedisBroker
+from dramatiq.common import dq_name
+from dramatiq.middleware import Middleware
+from dramatiq.middleware.prometheus import DB_PATH
+
+logger = logging.getLogger(__name__)
+
+WAIT_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600, float("inf"))
+
+
+class WorkerMetrics(Middleware):
+    def __init__(self, sample_interval_s: float = 5.0) -> None:
+        self.sample_interval_s = sample_interval_s
+        self.start_times: Dict[str, float] = {}
+        self.stop_sampling = threading.Event()
+
+    def after_process_boot(self, broker: dramatiq.Broker) -> None:
+        os.environ["prometheus_multiproc_dir"] = DB_PATH
+
+        # Imported at runtime, like dramatiq's Prometheus middleware does, so
+        # metrics are created in multiprocess mode
+        import prometheus_client as prom
+
+        self.registry = prom.CollectorRegistry()
+        # Every process samples the same queues, so report the highest sample
+        # of any process rather than their sum
+        self.queue_messages = prom.Gauge(
+            "lrm_queue_messages",
+            "Messages waiting in a queue",
+            ["queue_name", "state"],
+            registry=self.registry,
+            multiprocess_mode="max",
+        )
+        self.oldest_message_age = prom.Gauge(
+            "lrm_queue_oldest_message_age_seconds",
+            "Time the next message of a queue has been waiting",
+            ["queue_name"],
+            registry=self.registry,
+            multiprocess_mode="max",
+        )
+        self.message_wait = prom.Histogram(
+            "lrm_message_wait_seconds",
+            "Time from enqueue until a worker starts processing a message",
+            ["queue_name", "actor_name"],
+            buckets=WAIT_BUCKETS,
+            registry=self.registry,
+        )
+        self.threads = prom.Gauge(
+            "lrm_worker_threads",
+            "Worker threads processing messages",
+            registry=self.registry,
+            multiprocess_mode="livesum",
+        )
+        self.busy_seconds = prom.Counter(
+            "lrm_worker_busy_seconds",
+            "Time worker threads spent processing messages",
+            registry=self.registry,
+        )
+
+    def after_worker_boot(self, broker: dramatiq.Broker, worker) -> None:
+        # The async worker runs no dramatiq worker threads, and reports the
+        # threads of its own pool instead
+        if worker.worker_threads:
+            self.threads.set(worker.worker_threads)
+        if isinstance(broker, RedisBroker):
+            self.stop_sampling.clear()
+            threading.Thread(
+                target=self._sample_queues_forever, args=(broker,), daemon=True
+            ).start()
+
+    def before_worker_shutdown(self, broker: dramatiq.Broker, worker) -> None:
+        self.stop_sampling.set()
+
+    def before_process_message(self, broker: dramatiq.Broker, message) -> None:
+        now = time.time()
+        self.start_times[message.message_id] = now
+        # Retried messages are due at their eta, not when first enqueued
+        due_ms = message.options.get("eta", message.message_timestamp)
+        self.message_wait.labels(message.queue_name, message.actor_name).observe(
+            max(0.0, now - due_ms / 1000)
+        )
+
+    def after_process_message(
+        self, broker: dramatiq.Broker, message, *, result=None, exception=None
+    ) -> None:
+        start_time = self.start_times.pop(message.message_id, None)
+        if start_time is not None:
+            self.busy_seconds.inc(time.time() - start_time)
+
+    after_skip_message = after_process_message
+
+    def sample_queues(self, broker: RedisBroker) -> None:
+        """Read the length and head of every declared queue in two round trips"""
+        queues = sorted(broker.get_declared_queues())
+        pipeline = broker.client.pipeline(transaction=False)
+        for queue_name in queues:
+            pipeline.llen(f"{broker.namespace}:{queue_name}")
+            pipeline.llen(f"{broker.namespace}:{dq_name(queue_name)}")
+            pipeline.lindex(f"{broker.namespace}:{queue_name}", 0)
+        results = pipeline.execute()
+
+        heads = {}
+        for i, queue_name in enumerate(queues):
+            ready, delayed, head = results[3 * i : 3 * i + 3]
+            self.queue_messages.labels(queue_name, "ready").set(ready)
+            self.queue_messages.labels(queue_name, "delayed").set(delayed)
+            if head is None:
+                self.oldest_message_age.labels(queue_name).set(0)
+            else:
+                heads[queue_name] = head
+
+        for queue_name in heads:
+            pipeline.hget(f"{broker.namespace}:{queue_name}.msgs", heads[queue_name])
+        now = time.time()
+        for queue_name, data in zip(heads, pipeline.execute()):
+            # The head may have been consumed between the two round trips
+            age = 0.0
+            if data is not None:
+                message = dramatiq.Message.decode(data)
+                age = max(0.0, now - message.message_timestamp / 1000)
+            self.oldest_message_age.labels(queue_name).set(age)
+
+    def _sample_queues_forever(self, broker: RedisBroker) -> None:
+        while not self.stop_sampling.wait(self.sample_interval_s):
+            try:
+                self.sample_queues(broker)
+            except Exception as e:
+                logger.warning(f"Failed to sample queue metrics: {e!r}")
@@ -2,6 +2,8 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import os
+import threading
+from typing import Dict, Optional
 
 from diem import testnet, jsonrpc, diem_types
 from diem_utils.custody import Custody
@@ -14,9 +16,35 @@ CHAIN_ID = diem_types.ChainId(value=os.getenv("CHAIN_ID", testnet.CHAIN_ID.value
 Custody.init(CHAIN_ID)
 
 
+def _default_account_name() -> str:
+    return os.getenv("WALLET_CUSTODY_ACCOUNT_NAME", "merchant-wallet")
+
+
 class OnchainWallet(Vasp):
-    def __init__(self):
-        wallet_custody_account_name = os.getenv(
-            "WALLET_CUSTODY_ACCOUNT_NAME", "merchant-wallet"
+    def __init__(self, custody_account_name: Optional[str] = None):
+        super().__init__(
+            jsonrpc.Client(JSON_RPC_URL),
+            custody_account_name or _default_account_name(),
         )
-        super().__init__(jsonrpc.Client(JSON_RPC_URL), wallet_custody_account_name)
+
+
+_wallets: Dict[str, OnchainWallet] = {}
+_wallets_lock = threading.Lock()
+
+
+def get_wallet(custody_account_name: Optional[str] = None) -> OnchainWallet:
+    """
+    The process wide wallet of a custody account, created on first use.
+    Deriving its key and address and opening connections to the full node
+    happens once; the JSON-RPC client keeps its connections alive and is
+    safe to share between threads.
+    """
+    name = custody_account_name or _default_account_name()
+    wallet = _wallets.get(name)
+    if wallet is None:
+        with _wallets_lock:
+            wallet = _wallets.get(name)
+            if wallet is None:
+                wallet = OnchainWallet(name)
+                _wallets[name] = wallet
+    return wallet
@@ -1,7 +1,11 @@
 from .payment_service import (
     get_supported_currencies,
     process_incoming_transaction,
+    process_incoming_transactions,
     get_supported_network_currencies,
-    generate_payment_options_with_qr,
+    generate_payment_options,
+    payment_option_qr,
+    prerender_payment_qr,
+    reject_expired_payments,
 )
 from .payment_exceptions import *
@@ -1,26 +1,43 @@
 import logging
-from typing import Tuple
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
 
-import pyqrcode
 from diem import identifier, jsonrpc, testnet
 from diem_utils.types.currencies import FiatCurrency, DiemCurrency
 
 from .payment_exceptions import *
-from ..config import CHAIN_HRP, JSON_RPC_URL
-from ..onchainwallet import OnchainWallet
+from . import qr_cache
+from .qr_cache import QrImage
+from ..cache import CachedValue
+from ..config import CHAIN_HRP, JSON_RPC_URL, NETWORK_CURRENCIES_TTL_S, QR_SCALE
+from ..onchainwallet import get_wallet
 from ..storage import Payment, PaymentStatus, db_session
+from ..storage.models import PaymentStatusLog
 
 logger = logging.getLogger(__name__)
 
 
-def get_supported_network_currencies() -> Tuple[str]:
-    # TODO - error handling
+def _load_network_currencies() -> Tuple[str]:
     api = jsonrpc.Client(JSON_RPC_URL)
     supported_currency_info = api.get_currencies()
 
     return tuple(_.code for _ in supported_currency_info if _.code == DiemCurrency.XUS)
 
 
+_network_currencies = CachedValue(
+    _load_network_currencies, ttl_s=NETWORK_CURRENCIES_TTL_S, name="network currencies"
+)
+
+
+def get_supported_network_currencies() -> Tuple[str]:
+    """
+    Currencies of the network, from a process wide cache: only the first call
+    waits for the full node, later ones get the last good value while it is
+    refreshed in the background
+    """
+    return _network_currencies.get()
+
+
 def get_supported_currencies() -> Tuple[str]:
     # TODO - error handling
     supported_currency_info = [_.value for _ in FiatCurrency] + [
@@ -41,12 +58,94 @@ def process_incoming_transaction(
 ) -> None:
     """This function receives incoming payment events from the chain"""
     # Check if the payment is intended for us - this address is configured via environment variable, see config.py
-    if receiver_address != OnchainWallet().address_str:
+    if receiver_address != get_wallet().address_str:
         logging.debug("Received payment to unknown base address.")
         raise WrongReceiverAddressException("wrongaddr")
 
-    # Locate payment id and payment options related to the given subaddress
-    payment = Payment.find_by_subaddress(receiver_sub_address)
+    # Locate and lock the payment, loading its payment options along with it;
+    # clearing then needs no further queries until the commit
+    payment = Payment.find_by_subaddress(receiver_sub_address, for_update=True)
+    try:
+        _clear_payment(
+            payment,
+            version,
+            sender_address,
+            sender_sub_address,
+            receiver_sub_address,
+            amount,
+            currency,
+        )
+    except PaymentExpiredException:
+        db_session.commit()
+        raise
+    db_session.commit()
+
+
+def process_incoming_transactions(
+    transactions: List[Dict[str, Any]],
+) -> List[Optional[Exception]]:
+    """
+    Clear a batch of incoming payment events, given as keyword arguments of
+    process_incoming_transaction. All payments are looked up and locked in one
+    query and all changes are committed at once.
+    Returns, for each event in order, None if it cleared its payment or the
+    exception it was rejected with. If the batch fails to commit, the events
+    are processed one by one so one bad event does not hold back the rest.
+    """
+    vasp_address = get_wallet().address_str
+    payments = {
+        payment.subaddress: payment
+        for payment in Payment.find_by_subaddresses(
+            {t["receiver_sub_address"] for t in transactions}, for_update=True
+        )
+    }
+
+    results: List[Optional[Exception]] = []
+    for transaction in transactions:
+        try:
+            if transaction["receiver_address"] != vasp_address:
+                raise WrongReceiverAddressException("wrongaddr")
+            _clear_payment(
+                payments.get(transaction["receiver_sub_address"]),
+                transaction["version"],
+                transaction["sender_address"],
+                transaction["sender_sub_address"],
+                transaction["receiver_sub_address"],
+                transaction["amount"],
+                transaction["currency"],
+            )
+            results.append(None)
+        except PaymentServiceException as e:
+            results.append(e)
+
+    try:
+        db_session.commit()
+        return results
+    except Exception as e:
+        logger.exception(f"Failed to commit batch of incoming payments: {e}")
+        db_session.rollback()
+
+    results = []
+    for transaction in transactions:
+        try:
+            process_incoming_transaction(**transaction)
+            results.append(None)
+        except Exception as e:
+            db_session.rollback()
+            results.append(e)
+    return results
+
+
+def _clear_payment(
+    payment,
+    version,
+    sender_address,
+    sender_sub_address,
+    receiver_sub_address,
+    amount,
+    currency,
+) -> None:
+    """Check an incoming payment against its payment and clear it, without committing"""
     if payment is None:
         logging.debug(
             f"Could not find the qualifying payment {receiver_sub_address}, ignoring."
@@ -61,8 +160,8 @@ def process_incoming_transaction(
     if payment.is_expired():
         logging.debug(f"Payment expired: {payment.expiry_date}. Rejecting.")
         payment.set_status(PaymentStatus.rejected)
-        db_session.commit()
-        # TODO - Do we need a reaper process to simply mark expired payments as such?
+        # Expired payments are also rejected in bulk by the expiry reaper; this
+        # covers events arriving before it gets to them
         raise PaymentExpiredException("paymentexpired")
 
     # verify payment matches any of the payment options for this payment id
@@ -83,33 +182,103 @@ def process_incoming_transaction(
         amount,
         currency,
         version,
+        commit=False,
     )
-    db_session.commit()
 
 
-def generate_payment_options_with_qr(payment):
-    payment_options_with_qr = []
+def reject_expired_payments(batch_size: int, now: Optional[datetime] = None) -> int:
+    """
+    Mark created payments past their expiry date as rejected, batch_size at a
+    time: each batch is one locked lookup, one UPDATE and one bulk insert of
+    status logs, committed on its own so no transaction holds many row locks.
+    Payments locked by a transaction clearing them are skipped.
+    Returns the number of payments rejected.
+    """
+    now = now or datetime.utcnow()
+    rejected = 0
+    while True:
+        payment_ids = [
+            payment_id
+            for payment_id, in db_session.query(Payment.id)
+            .filter(Payment.status == PaymentStatus.created, Payment.expiry_date <= now)
+            .order_by(Payment.expiry_date)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        ]
+        if not payment_ids:
+            break
+
+        db_session.query(Payment).filter(Payment.id.in_(payment_ids)).update(
+            {Payment.status: PaymentStatus.rejected, Payment.last_update: now},
+            synchronize_session=False,
+        )
+        db_session.bulk_insert_mappings(
+            PaymentStatusLog,
+            [
+                dict(
+                    payment_id=payment_id, status=PaymentStatus.rejected, created_at=now
+                )
+                for payment_id in payment_ids
+            ],
+        )
+        db_session.commit()
+        rejected += len(payment_ids)
+        if len(payment_ids) < batch_size:
+            break
+    return rejected
 
-    vasp_addr = OnchainWallet().address_str
-    logger.debug(f"Current vasp address: {vasp_addr}")
-    full_payment_addr = identifier.encode_account(
-        vasp_addr, payment.subaddress, CHAIN_HRP
-    )
-    logger.debug(f"Rendering full payment link: {full_payment_addr}")
 
-    bech32addr = identifier.encode_account(vasp_addr, payment.subaddress, CHAIN_HRP)
+def generate_payment_options(payment):
+    """Payment options with their links; QR codes are served on their own"""
+    payment_options = []
+
+    bech32addr = _payment_address(payment)
 
     for payment_option in payment.payment_options:
-        payment_link = f"diem://{bech32addr}?c={payment_option.currency}&am={payment_option.amount}"
+        payment_link = _payment_link(bech32addr, payment_option)
         payment_option_attributes = dict(
             address=bech32addr,
             currency=payment_option.currency,
             amount=payment_option.amount,
             payment_link=payment_link,
         )
-        qr = pyqrcode.create(payment_link)
-        payment_option_attributes["qr_b64"] = qr.png_as_base64_str(scale=10)
 
-        payment_options_with_qr.append(payment_option_attributes)
+        payment_options.append(payment_option_attributes)
+
+    return payment_options
+
+
+def payment_option_qr(payment, option_id: int, image_format: str) -> Optional[QrImage]:
+    """The QR code of a payment option, or None if there is no such option"""
+    for payment_option in payment.payment_options:
+        if payment_option.id == option_id:
+            link = _payment_link(_payment_address(payment), payment_option)
+            return QrImage(link, image_format)
+    return None
+
+
+def prerender_payment_qr(payment) -> None:
+    """Render the QR codes of a new payment in the background"""
+    try:
+        bech32addr = _payment_address(payment)
+        qr_cache.prerender(
+            [_payment_link(bech32addr, option) for option in payment.payment_options],
+            QR_SCALE,
+        )
+    except Exception as e:
+        # The pay page renders them on demand anyway
+        logger.warning(f"Could not pre-render QR codes of payment {payment.id}: {e!r}")
+
+
+def _payment_address(payment) -> str:
+    vasp_addr = get_wallet().address_str
+    logger.debug(f"Current vasp address: {vasp_addr}")
+    full_payment_addr = identifier.encode_account(
+        vasp_addr, payment.subaddress, CHAIN_HRP
+    )
+    logger.debug(f"Rendering full payment link: {full_payment_addr}")
+    return full_payment_addr
+
 
-    return payment_options_with_qr
+def _payment_link(bech32addr: str, payment_option) -> str:
+    return f"diem://{bech32addr}?c={payment_option.currency}&am={payment_option.amount}"
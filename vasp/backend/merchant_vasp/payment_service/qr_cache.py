@@ -0,0 +1,110 @@
+import hashlib
+import io
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Iterable
+
+import pyqrcode
+
+from ..config import QR_CACHE_SIZE, QR_SCALE
+
+logger = logging.getLogger(__name__)
+
+MIMETYPES = {"png": "image/png", "svg": "image/svg+xml"}
+
+
+class QrCache:
+    """
+    Rendered QR code images, least recently used dropped first. Entries are
+    content addressed: the key is a digest of what is rendered (format,
+    payment link and scale), so the same link is rendered once whichever
+    payment or thread asks for it, and the key doubles as a strong ETag.
+    """
+
+    def __init__(self, max_entries: int) -> None:
+        self.max_entries = max_entries
+        self._images: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(link: str, scale: int, image_format: str = "png") -> str:
+        return hashlib.sha256(f"{image_format}:{scale}:{link}".encode()).hexdigest()
+
+    def image(self, link: str, scale: int, image_format: str = "png") -> bytes:
+        key = self.key(link, scale, image_format)
+        with self._lock:
+            image = self._images.get(key)
+            if image is not None:
+                self._images.move_to_end(key)
+                return image
+
+        # Rendered outside the lock, so threads rendering other links do not
+        # wait; two threads racing on one link may both render it
+        image = _render(link, scale, image_format)
+        with self._lock:
+            self._images[key] = image
+            self._images.move_to_end(key)
+            while len(self._images) > self.max_entries:
+                self._images.popitem(last=False)
+        return image
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._images
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._images)
+
+
+def _render(link: str, scale: int, image_format: str) -> bytes:
+    if image_format not in MIMETYPES:
+        raise ValueError(f"Unsupported QR code image format {image_format}")
+    buffer = io.BytesIO()
+    qr = pyqrcode.create(link)
+    if image_format == "svg":
+        qr.svg(buffer, scale=scale)
+    else:
+        qr.png(buffer, scale=scale)
+    return buffer.getvalue()
+
+
+qr_cache = QrCache(QR_CACHE_SIZE)
+
+
+@dataclass(frozen=True)
+class QrImage:
+    """A QR code to serve, whose ETag is known without rendering it"""
+
+    link: str
+    image_format: str = "png"
+    scale: int = QR_SCALE
+
+    @property
+    def etag(self) -> str:
+        return QrCache.key(self.link, self.scale, self.image_format)
+
+    @property
+    def mimetype(self) -> str:
+        return MIMETYPES[self.image_format]
+
+    def render(self) -> bytes:
+        return qr_cache.image(self.link, self.scale, self.image_format)
+
+
+_prerender_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="qr-render")
+
+
+def prerender(links: Iterable[str], scale: int) -> None:
+    """Render images in the background, so later requests find them cached"""
+    for link in links:
+        future = _prerender_executor.submit(qr_cache.image, link, scale)
+        future.add_done_callback(_log_failure)
+
+
+def _log_failure(future) -> None:
+    if future.exception() is not None:
+        logger.warning(f"Pre-rendering QR code failed: {future.exception()!r}")
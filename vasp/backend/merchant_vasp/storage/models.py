@@ -13,7 +13,9 @@ from sqlalchemy import (
     ForeignKey,
     BigInteger,
     Float,
+    Index,
     event,
+    inspect,
 )
 from sqlalchemy.orm import relationship
 from . import Base, db_session
@@ -76,6 +78,9 @@ class Payment(Base):
 
     merchant = relationship("Merchant", foreign_keys="Payment.merchant_id", lazy=True)
 
+    # For the expiry reaper, which looks for created payments past their expiry
+    __table_args__ = (Index("ix_payment_status_expiry_date", "status", "expiry_date"),)
+
     @staticmethod
     def add_payment(new_payment):
         db_session.add(new_payment)
@@ -88,8 +93,22 @@ class Payment(Base):
         ).one_or_none()
 
     @staticmethod
-    def find_by_subaddress(subaddress: str):
-        return Payment.query.filter_by(subaddress=subaddress).one_or_none()
+    def find_by_subaddress(subaddress: str, for_update: bool = False):
+        query = Payment.query.filter_by(subaddress=subaddress)
+        if for_update:
+            query = query.with_for_update(of=Payment)
+        return query.one_or_none()
+
+    @staticmethod
+    def find_by_subaddresses(subaddresses, for_update: bool = False):
+        if not subaddresses:
+            return []
+        query = Payment.query.filter(Payment.subaddress.in_(subaddresses))
+        if for_update:
+            # Lock rows in the same order in every worker, so that two batches
+            # sharing payments cannot deadlock
+            query = query.order_by(Payment.subaddress).with_for_update(of=Payment)
+        return query.all()
 
     @staticmethod
     def find_by_public_token(public_token: str):
@@ -99,11 +118,10 @@ class Payment(Base):
         return self.expiry_date <= datetime.utcnow()
 
     def is_payment_option_valid(self, amount: int, currency: str):
-        return (
-            PaymentOption.query.filter_by(
-                payment_id=self.id, amount=amount, currency=currency
-            ).one_or_none()
-            is not None
+        # Payment options are loaded along with the payment
+        return any(
+            option.amount == amount and option.currency == currency
+            for option in self.payment_options
         )
 
     def set_status(self, status: PaymentStatus):
@@ -114,7 +132,11 @@ class Payment(Base):
             raise ValueError(f"Cannot change {self.status} to {status}")
         self.status = status
         status_log = PaymentStatusLog(payment_id=self.id, status=status)
-        self.payment_status_logs.append(status_log)
+        if "payment_status_logs" in inspect(self).unloaded:
+            # Appending would first load the whole status history
+            db_session.add(status_log)
+        else:
+            self.payment_status_logs.append(status_log)
 
     def add_chain_transaction(
         self,
@@ -123,6 +145,7 @@ class Payment(Base):
         currency: int,
         tx_id: int,
         is_refund: bool = False,
+        commit: bool = True,
     ):
         self.chain_transactions.append(
             ChainTransaction(
@@ -134,7 +157,8 @@ class Payment(Base):
                 is_refund=is_refund,
             )
         )
-        db_session.commit()
+        if commit:
+            db_session.commit()
 
     def get_chain_transaction(self, tx_id: int):
         return ChainTransaction.query.filter_by(tx_id=tx_id).one_or_none()
@@ -173,3 +197,10 @@ class PaymentStatusLog(Base):
     payment_id = Column(String, ForeignKey("payment.id"), nullable=False)
     created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
     status = Column(String, nullable=False)
+
+
+class EventStreamProgress(Base):
+    __tablename__ = "event_stream_progress"
+
+    event_key = Column(String, primary_key=True)
+    sequence_number = Column(BigInteger, nullable=False)
@@ -1,6 +1,12 @@
 # pyre-ignore-all-errors
 from . import db_session, engine, Base
-from .models import Merchant, PaymentStatus, Payment, PaymentOption
+from .models import (
+    Merchant,
+    PaymentStatus,
+    Payment,
+    PaymentOption,
+    EventStreamProgress,
+)
 
 
 def clear_db() -> None:
@@ -1,15 +1,22 @@
 # VASP imports
 import logging
 import secrets
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime, timedelta
+from typing import Dict, Iterable
 
 from diem import utils, identifier
 from diem_utils.types.currencies import DiemCurrency
 
 from merchant_vasp import payment_service
-from merchant_vasp.config import PAYMENT_EXPIRE_MINUTES, CHAIN_HRP
+from merchant_vasp.config import (
+    PAYMENT_EXPIRE_MINUTES,
+    CHAIN_HRP,
+    QUOTE_DEADLINE_S,
+    QUOTE_TIMEOUT_S,
+)
 from merchant_vasp.fiat_liquidity_wrapper import FiatLiquidityWrapper
-from merchant_vasp.onchainwallet import OnchainWallet
+from merchant_vasp.onchainwallet import get_wallet
 from merchant_vasp.storage import (
     Payment,
     PaymentOption,
@@ -50,13 +57,16 @@ def create_payment(currency, merchant_reference_id, amount, merchant_id):
     # their preferred one for paying for this order.
     # Liquidity provider provides us with current rates.
     liquidity = FiatLiquidityWrapper(currency)
-    for quote_currency in payment_service.get_supported_network_currencies():
-        quote_price = liquidity.quote_price(quote_currency, amount)
+    quote_currencies = payment_service.get_supported_network_currencies()
+    quote_prices = _quote_prices(liquidity, quote_currencies, amount)
+    for quote_currency in quote_currencies:
+        if quote_currency not in quote_prices:
+            continue
 
         new_payment.payment_options.append(
             PaymentOption(
                 payment_id=new_payment.id,
-                amount=quote_price,
+                amount=quote_prices[quote_currency],
                 currency=quote_currency,
             )
         )
@@ -64,9 +74,47 @@ def create_payment(currency, merchant_reference_id, amount, merchant_id):
     logger.debug(
         f"Adding new payment (id {new_payment.id}) to sub address {new_payment.subaddress}"
     )
+    payment_service.prerender_payment_qr(new_payment)
     return new_payment
 
 
+_quote_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="quote")
+
+
+def _quote_prices(
+    liquidity: FiatLiquidityWrapper, quote_currencies: Iterable[str], amount
+) -> Dict[str, int]:
+    """
+    Price of amount in each of the quote currencies, all quoted at once, so
+    a payment waits for one liquidity provider round trip however many
+    currencies are offered. Currencies whose quote fails or misses the
+    deadline are left out; if none is quoted, the payment cannot be created.
+    """
+    futures = {
+        _quote_executor.submit(
+            liquidity.quote_price, quote_currency, amount, QUOTE_TIMEOUT_S
+        ): quote_currency
+        for quote_currency in quote_currencies
+    }
+    done, not_done = wait(futures, timeout=QUOTE_DEADLINE_S)
+
+    quote_prices = {}
+    error = TimeoutError(f"No quote within {QUOTE_DEADLINE_S}s")
+    for future in not_done:
+        future.cancel()
+        logger.warning(f"Quote for {futures[future]} missed the deadline")
+    for future in done:
+        try:
+            quote_prices[futures[future]] = future.result()
+        except Exception as e:
+            logger.warning(f"Failed to quote {futures[future]}: {e!r}")
+            error = e
+
+    if futures and not quote_prices:
+        raise error
+    return quote_prices
+
+
 def refund(payment):
     if not payment_can_refund(payment):
         raise InvalidPaymentStatus("unclearedrefund")
@@ -95,7 +143,7 @@ def refund(payment):
     refund_tx_id = None
 
     try:
-        wallet = OnchainWallet()
+        wallet = get_wallet()
 
         refund_tx_id, _ = wallet.send_transaction(
             refund_currency,
@@ -154,7 +202,7 @@ def payout(merchant: Merchant, payment: Payment):
         merchant.settlement_information,
     )
     # 3. Pay according to quote to payout_target
-    tx_id, _ = OnchainWallet().send_transaction(
+    tx_id, _ = get_wallet().send_transaction(
         DiemCurrency(client_payment.currency),
         client_payment.amount,
         liquidity_provider.vasp_address(),
@@ -178,7 +226,7 @@ def get_payment_events(payment):
 
 def get_merchant_full_addr(payment):
     return identifier.encode_account(
-        OnchainWallet().address_str, payment.subaddress, CHAIN_HRP
+        get_wallet().address_str, payment.subaddress, CHAIN_HRP
     )
 
 
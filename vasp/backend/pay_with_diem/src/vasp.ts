@@ -7,6 +7,8 @@ export interface PaymentOption {
   currency: Currency;
   amount: number;
   paymentLink: string;
+  qrPngURL: string;
+  qrSvgURL: string;
 }
 
 export interface PaymentOptions {
@@ -47,6 +49,8 @@ export default class Vasp {
         currency: op.currency,
         amount: op.amount,
         paymentLink: op.payment_link,
+        qrPngURL: op.qr_png_url,
+        qrSvgURL: op.qr_svg_url,
       })),
     };
   }
@@ -10,15 +10,38 @@ VASP_ADDR = os.getenv("VASP_ADDR")
 DEFL_CONFIG = {
     "diem_node_uri": JSON_RPC_URL,
     "sync_interval_ms": 1000,
+    "sync_concurrency": 4,
+    "batch_rpc": True,
+    "processor_batch_size": 50,
+    "metrics_port": int(os.getenv("PUBSUB_METRICS_PORT", 9100)),
     "progress_file_path": "/tmp/pubsub_progress",
     "accounts": [VASP_ADDR],
     "log_file": "/tmp/pubsub_log",
-    "progress_storage_type": "file",
+    "progress_storage_type": os.getenv("PUBSUB_PROGRESS_STORAGE_TYPE", "sql"),
+    "progress_storage_config": {
+        "flush_interval_ms": 5000,
+        "redis_key": "lrm:pubsub_progress",
+    },
     "account_subscription_storage_type": "in_memory",
     "transaction_progress_storage_type": "in_memory",
     "transaction_progress_storage_config": {},
     "pubsub_type": "pubsub.client.LRWPubSubClient",
     "pubsub_config": {"file_path": "/tmp/pubsub_messages"},
+    "subaddress_filter": {
+        "enabled": True,
+        "refresh_interval_ms": 0,
+        "full_reload_interval_ms": 300000,
+        "expiry_grace_ms": 600000,
+    },
+    "sharding": {
+        "enabled": os.getenv("PUBSUB_SHARDED", "false").lower() == "true",
+        "lease_ttl_ms": 15000,
+        "redis_prefix": "lrm:pubsub",
+    },
     "sync_strategy_type": "event_stream",
-    "sync_strategy_config": {"subscription_fetch_interval_ms": 1000, "batch_size": 2, },
+    "sync_strategy_config": {
+        "subscription_fetch_interval_ms": 1000,
+        "batch_size": 10,
+        "max_batch_size": 500,
+    },
 }
@@ -5,14 +5,40 @@ import argparse
 import json
 import sys
 
+from diem import jsonrpc
+
+from merchant_vasp.background_tasks import payment_queue_name, process_incoming_txn
 from pubsub import DEFL_CONFIG, VASP_ADDR
 from pubsub.client import LRWPubSubClient
-
+from pubsub.replay import replay
 
 parser = argparse.ArgumentParser(
     description="Pubsub CLI tool. Takes in pubsub config file or VASP_ADDR environment variable"
 )
 parser.add_argument("-f", "--file", type=str, help="LRW pubsub config file path")
+subparsers = parser.add_subparsers(dest="command")
+replay_parser = subparsers.add_parser(
+    "replay",
+    help="Re-send a range of events of one event key, without touching sync progress",
+)
+replay_parser.add_argument("--key", type=str, required=True, help="event key")
+replay_parser.add_argument(
+    "--from",
+    dest="from_sequence",
+    type=int,
+    required=True,
+    help="first sequence number",
+)
+replay_parser.add_argument(
+    "--to", dest="to_sequence", type=int, required=True, help="last sequence number"
+)
+replay_parser.add_argument(
+    "--workers", type=int, default=4, help="number of parallel page fetchers"
+)
+replay_parser.add_argument("--batch-size", type=int, default=100, help="page size")
+replay_parser.add_argument(
+    "--rate", type=float, default=50, help="max events per second, 0 for no limit"
+)
 args = parser.parse_args()
 
 if args.file:
@@ -30,5 +56,20 @@ else:  # load in by env var
 
 print(conf)
 
+if args.command == "replay":
+    count = replay(
+        jsonrpc.Client(conf["diem_node_uri"]),
+        process_incoming_txn,
+        args.key,
+        args.from_sequence,
+        args.to_sequence,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        rate=args.rate,
+        payment_queue_name=payment_queue_name,
+    )
+    print(f"Replayed {count} events of {args.key}")
+    sys.exit(0)
+
 client = LRWPubSubClient(conf)
 client.start()
@@ -0,0 +1,122 @@
+# pyre-strict
+
+# Copyright (c) The Diem Core Contributors
+# SPDX-License-Identifier: Apache-2.0
+
+import logging
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+import google.protobuf.json_format as parser
+import requests
+from diem import jsonrpc, utils
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = (5.0, 30.0)
+
+# method, params and a parser for the result
+Call = Tuple[str, List[Any], Callable[[Any], Any]]
+
+
+class BatchClient:
+    """
+    Sends many JSON-RPC calls to the full node as one batch request, over a
+    keep-alive session, so a poll cycle costs one HTTP round trip however
+    many event keys and accounts it covers.
+    Each call succeeds or fails on its own: results come back per call, as
+    the parsed result or the exception for that call.
+    """
+
+    def __init__(
+        self,
+        server_url: str,
+        session: Optional[requests.Session] = None,
+        timeout: Tuple[float, float] = DEFAULT_TIMEOUT,
+    ) -> None:
+        self.server_url = server_url
+        self.session: requests.Session = session or requests.Session()
+        self.timeout = timeout
+
+    def execute(self, calls: List[Call]) -> List[Union[Any, Exception]]:
+        """
+        Raises NetworkError or InvalidServerResponse if the batch as a whole
+        fails; errors of single calls are returned in their place
+        """
+        if not calls:
+            return []
+
+        request = [
+            {"jsonrpc": "2.0", "id": i, "method": method, "params": params}
+            for i, (method, params, _) in enumerate(calls)
+        ]
+        try:
+            response = self.session.post(
+                self.server_url, json=request, timeout=self.timeout
+            )
+            response.raise_for_status()
+            body = response.json()
+        except requests.RequestException as e:
+            raise jsonrpc.NetworkError(f"Error in connecting to server: {e}")
+        except ValueError as e:
+            raise jsonrpc.InvalidServerResponse(
+                f"Parse response as json failed: {e}, response: {response.text}"
+            )
+        if not isinstance(body, list):
+            raise jsonrpc.InvalidServerResponse(f"Expected a batch response: {body}")
+
+        # Batch responses may come back in any order
+        responses = {item.get("id"): item for item in body}
+        results = []
+        for i, (method, _, result_parser) in enumerate(calls):
+            item = responses.get(i)
+            if item is None:
+                results.append(
+                    jsonrpc.InvalidServerResponse(f"No response for {method} call")
+                )
+            elif "error" in item:
+                results.append(jsonrpc.JsonRpcError(f"{item['error']}"))
+            else:
+                try:
+                    results.append(result_parser(item.get("result")))
+                except parser.ParseError as e:
+                    results.append(
+                        jsonrpc.InvalidServerResponse(f"Parse result failed: {e}")
+                    )
+        return results
+
+    def get_events(
+        self, pages: Dict[str, Tuple[int, int]]
+    ) -> Dict[str, Union[List[jsonrpc.Event], Exception]]:
+        """Fetch one page of events, given as (start, limit), for each key"""
+        keys = list(pages)
+        results = self.execute(
+            [
+                ("get_events", [key, int(start), int(limit)], _parse_events)
+                for key, (start, limit) in pages.items()
+            ]
+        )
+        return dict(zip(keys, results))
+
+    def get_accounts(
+        self, addresses: List[str]
+    ) -> Dict[str, Union[Optional[jsonrpc.Account], Exception]]:
+        results = self.execute(
+            [
+                ("get_account", [utils.account_address_hex(address)], _parse_account)
+                for address in addresses
+            ]
+        )
+        return dict(zip(addresses, results))
+
+
+def _parse_events(result: Optional[List[Dict[str, Any]]]) -> List[jsonrpc.Event]:
+    return [
+        parser.ParseDict(event, jsonrpc.Event(), ignore_unknown_fields=True)
+        for event in result or []
+    ]
+
+
+def _parse_account(result: Optional[Dict[str, Any]]) -> Optional[jsonrpc.Account]:
+    if not result:
+        return None
+    return parser.ParseDict(result, jsonrpc.Account(), ignore_unknown_fields=True)
@@ -3,86 +3,373 @@
 # Copyright (c) The Diem Core Contributors
 # SPDX-License-Identifier: Apache-2.0
 
-import json
 import logging
 import time
-from typing import Any, Dict, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Union
 
+import requests
 from diem import jsonrpc
 
-from merchant_vasp.background_tasks import process_incoming_txn
+from merchant_vasp.background_tasks import (
+    payment_queue_name,
+    process_incoming_txn,
+    process_incoming_txn_batch,
+    record_unmatched_txn,
+)
+from . import metrics
+from .batch_rpc import BatchClient
+from .enqueue import send_batch
+from .progress import make_progress_storage
+from .sharding import KeyLeases
+from .subaddress_filter import OpenPaymentFilter
 from .types import LRWPubSubEvent
 
 logger = logging.getLogger(__name__)
 
 
-class FileProgressStorage:
-    def __init__(self, path: str) -> None:
-        self.path = path
-
-    def fetch_state(self) -> Dict[str, int]:
-        try:
-            with open(self.path, "r") as file:
-                return json.loads(file.read())
-        except (FileNotFoundError, json.JSONDecodeError):
-            return {}
-
-    def save_state(self, state: Dict[str, int]) -> None:
-        with open(self.path, "w") as file:
-            file.write(json.dumps(state))
-
-
 class LRWPubSubClient:
     def __init__(self, config: Dict[str, Any]) -> None:
         self.sync_interval_ms = config["sync_interval_ms"]
         self.accounts = config["accounts"]
 
         self.diem_node_uri = config["diem_node_uri"]
-        self.progress_file_path = config["progress_file_path"]
-        self.fetch_batch_size = 10
         self.processor = config.get("processor", process_incoming_txn)
+        self.unmatched_processor = config.get(
+            "unmatched_processor", record_unmatched_txn
+        )
+        # Above 1, events go to the batch processor in messages of up to this
+        # many events, each cleared with one payment lookup and one commit
+        self.processor_batch_size = config.get("processor_batch_size", 1)
+        self.batch_processor = config.get("batch_processor", process_incoming_txn_batch)
+        # Maps a receiver subaddress to the worker queue its events go to
+        self.payment_queue_name = config.get("payment_queue_name", payment_queue_name)
+        self.sync_concurrency = config.get("sync_concurrency", 1)
+
+        # Page size starts at batch_size and doubles while pages come back
+        # full, up to max_batch_size, so a backlog drains in a few big pages
+        sync_strategy_config = config.get("sync_strategy_config", {})
+        self.fetch_batch_size = sync_strategy_config.get("batch_size", 10)
+        self.max_fetch_batch_size = sync_strategy_config.get(
+            "max_batch_size", self.fetch_batch_size
+        )
+        self.batch_sizes: Dict[str, int] = {}
+        self.catching_up = False
+        # Ledger version each event key is known to be fully read up to
+        self.synced_versions: Dict[str, int] = {}
+        # Version of the last event processed for each key
+        self.last_event_versions: Dict[str, int] = {}
+        self.metrics_port: Optional[int] = config.get("metrics_port")
 
         logger.info(f"Loaded LRWPubSubClient with config: {config}")
 
-        self.client = jsonrpc.Client(self.diem_node_uri)
-        self.progress = FileProgressStorage(self.progress_file_path)
+        # One keep-alive connection pool for every call to the full node
+        self.session = requests.Session()
+        self.client = jsonrpc.Client(self.diem_node_uri, session=self.session)
+        # With batching, the pages of all keys are fetched in one HTTP request
+        # per cycle instead of one request per key
+        self.batch_client: Optional[BatchClient] = None
+        if config.get("batch_rpc", False):
+            self.batch_client = BatchClient(self.diem_node_uri, session=self.session)
+        self.progress = make_progress_storage(config)
+
+        # Event keys are independent streams, so with more than one receiving
+        # account we fetch them side by side instead of one after the other
+        self.executor: Optional[ThreadPoolExecutor] = None
+        if self.sync_concurrency > 1:
+            self.executor = ThreadPoolExecutor(
+                max_workers=self.sync_concurrency, thread_name_prefix="pubsub-sync"
+            )
+
+        # Events paying to no open payment skip the payment worker and the DB
+        self.subaddress_filter: Optional[OpenPaymentFilter] = None
+        filter_config = config.get("subaddress_filter", {})
+        if filter_config.get("enabled", False):
+            self.subaddress_filter = OpenPaymentFilter(filter_config)
+
+        # In sharded mode every replica only syncs the keys it holds a lease
+        # on, so progress has to live where all replicas can read it
+        self.leases: Optional[KeyLeases] = None
+        sharding_config = config.get("sharding", {})
+        if sharding_config.get("enabled", False):
+            if config.get("progress_storage_type", "file") == "file":
+                raise ValueError(
+                    "Sharded pubsub requires sql or redis progress storage"
+                )
+            self.leases = KeyLeases(sharding_config)
 
     def start(self) -> None:
+        if self.metrics_port:
+            metrics.start_metrics_server(self.metrics_port)
         sync_state = self.init_progress_state()
-        while True:
-            sync_state = self.sync(sync_state, catch_error=True)
-            time.sleep(self.sync_interval_ms / 1000)
+        event_keys = list(sync_state)
+        if self.leases is not None:
+            sync_state = {}
+            self.leases.start_renewing()
+        try:
+            while True:
+                if self.leases is not None and self.leases.rebalance_due():
+                    sync_state = self.rebalance(event_keys, sync_state)
+                sync_state = self.sync(sync_state, catch_error=True)
+                if not self.catching_up:
+                    time.sleep(self.sync_interval_ms / 1000)
+        finally:
+            self.progress.flush()
+            if self.leases is not None:
+                self.leases.stop_renewing()
+                self.leases.release(sync_state)
+
+    def rebalance(self, event_keys: List[str], state: Dict[str, int]) -> Dict[str, int]:
+        """
+        Renew the leases of the keys this replica keeps, hand over the keys now
+        assigned to another replica and pick up newly assigned ones
+        """
+        state = self.drop_lost_keys(state)
+        replicas = self.leases.heartbeat()
+        assigned = self.leases.assigned(event_keys, replicas)
+
+        leaving = [key for key in state if key not in assigned]
+        if leaving:
+            # The next owner resumes from stored progress, so write it out first
+            self.progress.flush()
+            self.leases.release(leaving)
+
+        held = self.leases.acquire(assigned)
+        leaving += [key for key in state if key not in held and key not in leaving]
+        joining = [key for key in held if key not in state]
+        stored_state = self.progress.fetch_state() if joining else {}
+
+        for key in leaving + joining:
+            self.synced_versions.pop(key, None)
+            self.last_event_versions.pop(key, None)
+            self.batch_sizes.pop(key, None)
+        for key in leaving:
+            metrics.forget_event_key(key)
+        if leaving or joining:
+            logger.info(
+                f"replica {self.leases.replica_id} of {len(replicas)} "
+                f"released {leaving}, acquired {joining}"
+            )
+
+        return {key: state.get(key, stored_state.get(key, 0)) for key in held}
+
+    def drop_lost_keys(self, state: Dict[str, int]) -> Dict[str, int]:
+        """
+        Leave out keys whose lease lapsed, e.g. during a slow cycle: their new
+        owner syncs them now and may be ahead, so their progress must not be
+        written from here
+        """
+        if self.leases is None:
+            return state
+        lost = [key for key in state if not self.leases.holds(key)]
+        if not lost:
+            return state
+        logger.warning(f"lease lapsed for {lost}, no longer syncing them")
+        self.progress.discard(lost)
+        for key in lost:
+            self.synced_versions.pop(key, None)
+            self.last_event_versions.pop(key, None)
+            self.batch_sizes.pop(key, None)
+            metrics.forget_event_key(key)
+        return {key: num for key, num in state.items() if key not in lost}
 
     def sync(
-            self, state: Dict[str, int], catch_error: Optional[bool] = False
+        self, state: Dict[str, int], catch_error: Optional[bool] = False
     ) -> Dict[str, int]:
+        state = self.drop_lost_keys(state)
         after_sync_state = state.copy()
-        for key in state:
-            try:
-                sequence_num = state[key]
-                events = self.client.get_events(
-                    key, sequence_num, self.fetch_batch_size
+
+        # A key already read up to the current ledger version has nothing new,
+        # so while the chain is quiet a cycle costs a single get_metadata call
+        ledger_version = self.fetch_ledger_version()
+        keys = [
+            key
+            for key in state
+            if ledger_version is None
+            or self.synced_versions.get(key, -1) < ledger_version
+        ]
+
+        # Payments are committed before they can be paid, so refreshing ahead
+        # of fetching guarantees the filter knows every payable subaddress
+        if keys and self.subaddress_filter is not None:
+            self.subaddress_filter.refresh()
+
+        limits = {key: self.batch_sizes.get(key, self.fetch_batch_size) for key in keys}
+        pages = {key: None for key in keys}
+        if keys and self.batch_client is not None:
+            pages = self.fetch_pages({key: (state[key], limits[key]) for key in keys})
+
+        if self.executor is None:
+            results = {
+                key: self.sync_key(
+                    key, state[key], limits[key], catch_error, pages[key]
+                )
+                for key in keys
+            }
+        else:
+            futures = {
+                key: self.executor.submit(
+                    self.sync_key,
+                    key,
+                    state[key],
+                    limits[key],
+                    catch_error,
+                    pages[key],
                 )
-                for event in events:
-                    lrw_event = LRWPubSubEvent.from_jsonrpc_event(event)
-                    self.processor.send(lrw_event)
-                    logger.info(f"SUCCESS: sent to wallet onchain {lrw_event}")
+                for key in keys
+            }
+            results = {key: future.result() for key, future in futures.items()}
+
+        full_pages = []
+        for key, sequence_num in results.items():
+            if sequence_num is None:
+                self.batch_sizes[key] = self.fetch_batch_size
+                continue
+            after_sync_state[key] = sequence_num
+            if sequence_num - state[key] == limits[key]:
+                full_pages.append(key)
+                self.batch_sizes[key] = min(limits[key] * 2, self.max_fetch_batch_size)
+            else:
+                self.batch_sizes[key] = self.fetch_batch_size
+                if ledger_version is not None:
+                    self.synced_versions[key] = ledger_version
 
-                after_sync_state[key] = sequence_num + len(events)
-            except Exception as exc:
-                logger.exception(f"failed to perform sync for event key {key}: {exc}")
-                if not catch_error:
-                    raise exc
+        catching_up = len(full_pages) > 0
+        if catching_up != self.catching_up:
+            logger.info(
+                f"{'entering' if catching_up else 'leaving'} backlog catch-up mode"
+            )
+        self.catching_up = catching_up
 
+        after_sync_state = self.drop_lost_keys(after_sync_state)
+        self.record_metrics(after_sync_state, ledger_version)
         self.progress.save_state(after_sync_state)
-        logger.info(f"processed next chunk. New state is {after_sync_state}")
+        if keys:
+            logger.info(f"processed next chunk. New state is {after_sync_state}")
 
         return after_sync_state
 
+    def fetch_ledger_version(self) -> Optional[int]:
+        try:
+            return self.client.get_metadata().version
+        except Exception as exc:
+            metrics.ERRORS.labels("get_metadata").inc()
+            logger.warning(f"failed to fetch ledger version: {exc}")
+            return None
+
+    def fetch_pages(
+        self, pages: Dict[str, Any]
+    ) -> Dict[str, Union[List[jsonrpc.Event], Exception]]:
+        """
+        Fetch the next page of every key in one batch request. A failed batch
+        fails every key, which is then retried on the next cycle.
+        """
+        try:
+            with metrics.GET_EVENTS_SECONDS.time():
+                return self.batch_client.get_events(pages)
+        except Exception as exc:
+            return {key: exc for key in pages}
+
+    def record_metrics(
+        self, state: Dict[str, int], ledger_version: Optional[int]
+    ) -> None:
+        if ledger_version is not None:
+            metrics.LEDGER_VERSION.set(ledger_version)
+        for key, sequence_num in state.items():
+            metrics.EVENT_KEY_SEQUENCE.labels(key).set(sequence_num)
+            if ledger_version is None:
+                continue
+            if self.synced_versions.get(key) == ledger_version:
+                metrics.EVENT_KEY_LAG.labels(key).set(0)
+            elif key in self.last_event_versions:
+                metrics.EVENT_KEY_LAG.labels(key).set(
+                    max(0, ledger_version - self.last_event_versions[key])
+                )
+
+    def sync_key(
+        self,
+        key: str,
+        sequence_num: int,
+        limit: int,
+        catch_error: Optional[bool] = False,
+        page: Union[List[jsonrpc.Event], Exception, None] = None,
+    ) -> Optional[int]:
+        """
+        Fetch and process the next page of a single event key, in order.
+        A page already fetched in a batch, or the error fetching it, can be
+        passed in as page.
+        Returns the sequence number to continue from on the next cycle, or
+        None if the page could not be processed.
+        """
+        stage = "get_events"
+        try:
+            if isinstance(page, Exception):
+                raise page
+            if page is not None:
+                events = page
+            else:
+                with metrics.GET_EVENTS_SECONDS.time():
+                    events = self.client.get_events(key, sequence_num, limit)
+
+            stage = "enqueue"
+            lrw_events = [LRWPubSubEvent.from_jsonrpc_event(event) for event in events]
+            # Progress only moves past this page once all of it is enqueued
+            with metrics.ENQUEUE_SECONDS.time():
+                if self.subaddress_filter is None:
+                    self.send_events(lrw_events)
+                else:
+                    matched = []
+                    unmatched = []
+                    for lrw_event in lrw_events:
+                        if self.subaddress_filter.may_match(lrw_event):
+                            matched.append(lrw_event)
+                        else:
+                            unmatched.append(lrw_event)
+                    self.send_events(matched)
+                    send_batch(self.unmatched_processor, unmatched)
+            for lrw_event in lrw_events:
+                logger.info(f"SUCCESS: sent to wallet onchain {lrw_event}")
+
+            if lrw_events:
+                self.last_event_versions[key] = lrw_events[-1].version
+                metrics.EVENTS.labels(key).inc(len(lrw_events))
+            return sequence_num + len(events)
+        except Exception as exc:
+            metrics.ERRORS.labels(stage).inc()
+            logger.exception(f"failed to perform sync for event key {key}: {exc}")
+            if not catch_error:
+                raise exc
+
+        return None
+
+    def send_events(self, events: List[LRWPubSubEvent]) -> None:
+        events_by_queue: Dict[Optional[str], List[LRWPubSubEvent]] = {}
+        for event in events:
+            queue_name = self.payment_queue_name(event.receiver_sub_address)
+            events_by_queue.setdefault(queue_name, []).append(event)
+
+        size = self.processor_batch_size
+        for queue_name, queue_events in events_by_queue.items():
+            if size > 1:
+                batches = [
+                    queue_events[i : i + size]
+                    for i in range(0, len(queue_events), size)
+                ]
+                send_batch(self.batch_processor, batches, queue_name)
+            else:
+                send_batch(self.processor, queue_events, queue_name)
+
     def init_progress_state(self) -> Dict[str, int]:
         state = self.progress.fetch_state()
-        for address in self.accounts:
-            account = self.client.get_account(address)
+        if self.batch_client is not None:
+            accounts = self.batch_client.get_accounts(self.accounts)
+        else:
+            accounts = {
+                address: self.client.get_account(address) for address in self.accounts
+            }
+        for address, account in accounts.items():
+            if isinstance(account, Exception):
+                raise account
             if account is None:
                 logger.error(f"account not found: {address}")
                 continue
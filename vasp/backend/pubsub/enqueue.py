@@ -0,0 +1,59 @@
+# pyre-strict
+
+# Copyright (c) The Diem Core Contributors
+# SPDX-License-Identifier: Apache-2.0
+
+import logging
+from typing import Any, List, Optional
+from uuid import uuid4
+
+import dramatiq
+from dramatiq.brokers.redis import RedisBroker
+
+logger = logging.getLogger(__name__)
+
+
+def send_batch(
+    processor: Any, args_list: List[Any], queue_name: Optional[str] = None
+) -> None:
+    """
+    Enqueue one message per item of args_list to the processor actor, on
+    queue_name if given instead of the actor's own queue.
+    On a Redis broker the whole batch is written in a single MULTI/EXEC
+    round-trip, so either every message is queued or the call raises.
+    """
+    if not args_list:
+        return
+
+    if not isinstance(processor, dramatiq.Actor):
+        for args in args_list:
+            processor.send(args)
+        return
+
+    queue_name = queue_name or processor.queue_name
+    broker = processor.broker
+    if not isinstance(broker, RedisBroker):
+        for args in args_list:
+            broker.enqueue(processor.message(args).copy(queue_name=queue_name))
+        return
+
+    pipeline = broker.client.pipeline(transaction=True)
+    messages = []
+    for args in args_list:
+        # Same layout as RedisBroker.enqueue: the message body lives in the
+        # $namespace:$queue.msgs hash and its id is pushed on $namespace:$queue
+        message = processor.message(args).copy(
+            queue_name=queue_name, options={"redis_message_id": str(uuid4())}
+        )
+        broker.emit_before("enqueue", message, None)
+        redis_message_id = message.options["redis_message_id"]
+        queue_key = f"{broker.namespace}:{message.queue_name}"
+        pipeline.hset(f"{queue_key}.msgs", redis_message_id, message.encode())
+        pipeline.rpush(queue_key, redis_message_id)
+        messages.append(message)
+
+    pipeline.execute()
+
+    for message in messages:
+        broker.emit_after("enqueue", message, None)
+    logger.debug(f"enqueued {len(messages)} messages to {processor.actor_name}")
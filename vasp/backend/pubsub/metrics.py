@@ -0,0 +1,46 @@
+# pyre-strict
+
+# Copyright (c) The Diem Core Contributors
+# SPDX-License-Identifier: Apache-2.0
+
+import logging
+
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+logger = logging.getLogger(__name__)
+
+LEDGER_VERSION = Gauge(
+    "pubsub_ledger_version", "Latest ledger version reported by the full node"
+)
+EVENT_KEY_SEQUENCE = Gauge(
+    "pubsub_event_key_sequence",
+    "Next sequence number to be processed for an event key",
+    ["key"],
+)
+EVENT_KEY_LAG = Gauge(
+    "pubsub_event_key_lag_versions",
+    "Ledger versions between the chain head and the last processed event of a key",
+    ["key"],
+)
+EVENTS = Counter("pubsub_events", "Events fetched from the chain and enqueued", ["key"])
+GET_EVENTS_SECONDS = Histogram(
+    "pubsub_get_events_seconds", "Latency of get_events JSON-RPC calls"
+)
+ENQUEUE_SECONDS = Histogram(
+    "pubsub_enqueue_seconds", "Latency of enqueueing a page of events"
+)
+ERRORS = Counter("pubsub_errors", "Failed pubsub operations", ["stage"])
+
+
+def start_metrics_server(port: int, addr: str = "0.0.0.0") -> None:
+    start_http_server(port, addr)
+    logger.info(f"Serving pubsub metrics on {addr}:{port}")
+
+
+def forget_event_key(key: str) -> None:
+    """Stop exporting a key this process no longer syncs"""
+    for metric in (EVENT_KEY_SEQUENCE, EVENT_KEY_LAG, EVENTS):
+        try:
+            metric.remove(key)
+        except KeyError:
+            pass
@@ -0,0 +1,145 @@
+# pyre-strict
+
+# Copyright (c) The Diem Core Contributors
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, Iterable, Optional
+
+import redis
+
+from merchant_vasp.config import REDIS_HOST, REDIS_PORT, REDIS_PASSWORD
+from merchant_vasp.storage import Base, EventStreamProgress, db_session, engine
+
+logger = logging.getLogger(__name__)
+
+
+class FileProgressStorage:
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    def fetch_state(self) -> Dict[str, int]:
+        try:
+            with open(self.path, "r") as file:
+                return json.loads(file.read())
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def save_state(self, state: Dict[str, int]) -> None:
+        # Write aside and rename over the old file, so a crash mid-write
+        # never leaves a truncated progress file behind
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as file:
+            file.write(json.dumps(state))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, self.path)
+
+
+class SqlProgressStorage:
+    """Keeps event stream progress in the VASP database"""
+
+    def __init__(self) -> None:
+        Base.metadata.create_all(bind=engine, tables=[EventStreamProgress.__table__])
+
+    def fetch_state(self) -> Dict[str, int]:
+        return {
+            progress.event_key: progress.sequence_number
+            for progress in EventStreamProgress.query.all()
+        }
+
+    def save_state(self, state: Dict[str, int]) -> None:
+        try:
+            for key, sequence_number in state.items():
+                db_session.merge(
+                    EventStreamProgress(event_key=key, sequence_number=sequence_number)
+                )
+            db_session.commit()
+        except Exception:
+            db_session.rollback()
+            raise
+
+
+class RedisProgressStorage:
+    """Keeps event stream progress in a Redis hash, one field per event key"""
+
+    def __init__(self, redis_key: str) -> None:
+        self.redis_key = redis_key
+        self.redis = redis.StrictRedis(
+            host=REDIS_HOST, port=REDIS_PORT, db=0, password=REDIS_PASSWORD
+        )
+
+    def fetch_state(self) -> Dict[str, int]:
+        return {
+            key.decode(): int(sequence_number)
+            for key, sequence_number in self.redis.hgetall(self.redis_key).items()
+        }
+
+    def save_state(self, state: Dict[str, int]) -> None:
+        if state:
+            self.redis.hset(self.redis_key, mapping=state)
+
+
+class BufferedProgressStorage:
+    """
+    Coalesces progress writes of another storage: an unchanged state is never
+    written again, and a changed one is written at most once per flush interval.
+    Events seen after the last flush are re-sent after a crash, which is safe
+    since an already cleared payment can not be cleared twice.
+    """
+
+    def __init__(self, storage: Any, flush_interval_ms: int) -> None:
+        self.storage = storage
+        self.flush_interval_ms = flush_interval_ms
+        self._saved_state: Optional[Dict[str, int]] = None
+        self._pending_state: Optional[Dict[str, int]] = None
+        self._last_flush: Optional[float] = None
+
+    def fetch_state(self) -> Dict[str, int]:
+        state = self.storage.fetch_state()
+        self._saved_state = state.copy()
+        return state
+
+    def save_state(self, state: Dict[str, int]) -> None:
+        self._pending_state = state.copy()
+        if (
+            self._last_flush is None
+            or (time.monotonic() - self._last_flush) * 1000 >= self.flush_interval_ms
+        ):
+            self.flush()
+
+    def discard(self, keys: Iterable[str]) -> None:
+        """Drop unwritten progress of keys, e.g. now synced by another replica"""
+        if self._pending_state is not None:
+            for key in keys:
+                self._pending_state.pop(key, None)
+
+    def flush(self) -> None:
+        if self._pending_state is None or self._pending_state == self._saved_state:
+            return
+        self.storage.save_state(self._pending_state)
+        self._saved_state = self._pending_state
+        self._pending_state = None
+        self._last_flush = time.monotonic()
+
+
+def make_progress_storage(config: Dict[str, Any]) -> BufferedProgressStorage:
+    storage_type = config.get("progress_storage_type", "file")
+    storage_config = config.get("progress_storage_config", {})
+
+    if storage_type == "file":
+        storage = FileProgressStorage(config["progress_file_path"])
+    elif storage_type == "sql":
+        storage = SqlProgressStorage()
+    elif storage_type == "redis":
+        storage = RedisProgressStorage(
+            storage_config.get("redis_key", "lrm:pubsub_progress")
+        )
+    else:
+        raise ValueError(f"Unknown progress storage type: {storage_type}")
+
+    logger.info(f"Using {storage_type} progress storage")
+    return BufferedProgressStorage(storage, storage_config.get("flush_interval_ms", 0))
@@ -0,0 +1,91 @@
+# pyre-strict
+
+# Copyright (c) The Diem Core Contributors
+# SPDX-License-Identifier: Apache-2.0
+
+import logging
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from diem import jsonrpc
+
+from .enqueue import send_batch
+from .types import LRWPubSubEvent
+
+logger = logging.getLogger(__name__)
+
+
+def replay(
+    client: jsonrpc.Client,
+    processor: Any,
+    key: str,
+    from_sequence: int,
+    to_sequence: int,
+    workers: int = 4,
+    batch_size: int = 100,
+    rate: float = 0,
+    payment_queue_name: Optional[Callable[[Optional[str]], Optional[str]]] = None,
+) -> int:
+    """
+    Re-send the events of one event key with sequence numbers from
+    from_sequence to to_sequence (inclusive) to the processor.
+    Pages are fetched by a pool of workers but handed to the processor in
+    order, at most `rate` events per second (0 for no limit).
+    Like live events, each event goes to the queue payment_queue_name maps
+    its receiver subaddress to, if given, so it is processed in order with
+    the other events of its payment.
+    Live pubsub progress is neither read nor written.
+    Returns the number of events sent.
+    """
+    page_starts = iter(range(from_sequence, to_sequence + 1, batch_size))
+    sent = 0
+    started = time.monotonic()
+
+    with ThreadPoolExecutor(
+        max_workers=workers, thread_name_prefix="pubsub-replay"
+    ) as executor:
+
+        def submit_next() -> None:
+            start = next(page_starts, None)
+            if start is not None:
+                limit = min(batch_size, to_sequence + 1 - start)
+                future = executor.submit(client.get_events, key, start, limit)
+                pending.append((limit, future))
+
+        # Keep a bounded window of pages in flight so memory does not grow
+        # with the size of the range
+        pending = deque()
+        for _ in range(workers * 2):
+            submit_next()
+
+        while pending:
+            limit, future = pending.popleft()
+            events = future.result()
+            submit_next()
+
+            if rate > 0:
+                wait_s = started + (sent + len(events)) / rate - time.monotonic()
+                if wait_s > 0:
+                    time.sleep(wait_s)
+
+            events_by_queue: Dict[Optional[str], List[LRWPubSubEvent]] = {}
+            for event in events:
+                lrw_event = LRWPubSubEvent.from_jsonrpc_event(event)
+                queue_name = None
+                if payment_queue_name is not None:
+                    queue_name = payment_queue_name(lrw_event.receiver_sub_address)
+                events_by_queue.setdefault(queue_name, []).append(lrw_event)
+            for queue_name, queue_events in events_by_queue.items():
+                send_batch(processor, queue_events, queue_name)
+            sent += len(events)
+            logger.info(f"replayed {sent} events of {key}")
+
+            if len(events) < limit:
+                # A short page means the chain head was reached
+                for _, queued in pending:
+                    queued.cancel()
+                break
+
+    return sent
@@ -0,0 +1,176 @@
+# pyre-strict
+
+# Copyright (c) The Diem Core Contributors
+# SPDX-License-Identifier: Apache-2.0
+
+import hashlib
+import logging
+import os
+import socket
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+import redis
+
+from merchant_vasp.config import REDIS_HOST, REDIS_PORT, REDIS_PASSWORD
+
+logger = logging.getLogger(__name__)
+
+# Extend a lease only if this replica still holds it
+_RENEW_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("pexpire", KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# Drop a lease only if this replica still holds it
+_RELEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+def owner_of(key: str, replicas: Iterable[str]) -> Optional[str]:
+    """
+    Rendezvous hashing: every replica ranks the key the same way, and when a
+    replica joins or leaves only the keys it wins or held change owner
+    """
+
+    def weight(replica: str) -> int:
+        return int.from_bytes(
+            hashlib.sha256(f"{replica}:{key}".encode()).digest()[:8], "big"
+        )
+
+    return max(replicas, key=weight, default=None)
+
+
+class KeyLeases:
+    """
+    Splits event keys between pubsub replicas. Replicas announce themselves
+    in a Redis sorted set scored by heartbeat expiry, and each key is owned
+    through a lease that its owner renews. When a replica dies it drops out
+    of the set and its leases expire, so the surviving replicas take over
+    its keys within one lease TTL.
+
+    Held leases are renewed from a background thread, see start_renewing, so
+    a sync cycle blocked on a slow full node cannot outlast them; a lease
+    that could not be renewed is no longer held, see holds.
+    """
+
+    def __init__(self, config: Dict[str, Any]) -> None:
+        self.replica_id: str = config.get(
+            "replica_id", f"{socket.gethostname()}:{os.getpid()}"
+        )
+        self.lease_ttl_ms: int = config.get("lease_ttl_ms", 15000)
+        self.prefix: str = config.get("redis_prefix", "lrm:pubsub")
+        self.redis = redis.StrictRedis(
+            host=REDIS_HOST, port=REDIS_PORT, db=0, password=REDIS_PASSWORD
+        )
+        self._renew = self.redis.register_script(_RENEW_SCRIPT)
+        self._release = self.redis.register_script(_RELEASE_SCRIPT)
+        # Kept apart from the background heartbeats, which would keep it fresh
+        self._last_rebalance: Optional[float] = None
+        # Monotonic time until which each held lease is known to be ours
+        self._held: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._stop_renewing = threading.Event()
+
+    def rebalance_due(self) -> bool:
+        """Whether to rebalance now, three times per TTL; true once per round"""
+        now = time.monotonic()
+        if (
+            self._last_rebalance is not None
+            and (now - self._last_rebalance) * 1000 < self.lease_ttl_ms / 3
+        ):
+            return False
+        self._last_rebalance = now
+        return True
+
+    def heartbeat(self) -> List[str]:
+        """Announce this replica and return every live replica"""
+        now_ms = int(time.time() * 1000)
+        replicas_key = f"{self.prefix}:replicas"
+        pipeline = self.redis.pipeline(transaction=True)
+        pipeline.zadd(replicas_key, {self.replica_id: now_ms + self.lease_ttl_ms})
+        pipeline.zremrangebyscore(replicas_key, "-inf", now_ms)
+        pipeline.zrange(replicas_key, 0, -1)
+        replicas = pipeline.execute()[-1]
+        return [replica.decode() for replica in replicas]
+
+    def assigned(self, keys: Iterable[str], replicas: List[str]) -> Set[str]:
+        return {key for key in keys if owner_of(key, replicas) == self.replica_id}
+
+    def acquire(self, keys: Iterable[str]) -> Set[str]:
+        """Take or renew the lease of each key, returning the keys now held"""
+        held = set()
+        for key in keys:
+            # Counted from before the request, as Redis starts the TTL later
+            valid_until = time.monotonic() + self.lease_ttl_ms / 1000
+            lease_key = self._lease_key(key)
+            acquired = self.redis.set(
+                lease_key, self.replica_id, nx=True, px=self.lease_ttl_ms
+            )
+            if acquired or self._renew(
+                keys=[lease_key], args=[self.replica_id, self.lease_ttl_ms]
+            ):
+                held.add(key)
+                with self._lock:
+                    self._held[key] = valid_until
+            else:
+                with self._lock:
+                    self._held.pop(key, None)
+        return held
+
+    def renew(self) -> None:
+        """Renew the leases held, dropping those another replica has taken"""
+        with self._lock:
+            keys = list(self._held)
+        for key in keys:
+            valid_until = time.monotonic() + self.lease_ttl_ms / 1000
+            renewed = self._renew(
+                keys=[self._lease_key(key)], args=[self.replica_id, self.lease_ttl_ms]
+            )
+            with self._lock:
+                if key not in self._held:
+                    continue
+                if renewed:
+                    self._held[key] = valid_until
+                else:
+                    logger.warning(f"lost the lease of event key {key}")
+                    del self._held[key]
+
+    def holds(self, key: str) -> bool:
+        """Whether the lease of key is still known to be held by this replica"""
+        with self._lock:
+            return self._held.get(key, 0) > time.monotonic()
+
+    def start_renewing(self) -> None:
+        """Heartbeat and renew held leases three times per TTL, until stopped"""
+        self._stop_renewing.clear()
+        threading.Thread(
+            target=self._renew_forever, name="pubsub-leases", daemon=True
+        ).start()
+
+    def stop_renewing(self) -> None:
+        self._stop_renewing.set()
+
+    def release(self, keys: Iterable[str]) -> None:
+        for key in keys:
+            with self._lock:
+                self._held.pop(key, None)
+            self._release(keys=[self._lease_key(key)], args=[self.replica_id])
+
+    def _renew_forever(self) -> None:
+        while not self._stop_renewing.wait(self.lease_ttl_ms / 3000):
+            try:
+                self.heartbeat()
+                self.renew()
+            except Exception as e:
+                logger.warning(f"failed to renew leases: {e!r}")
+
+    def _lease_key(self, key: str) -> str:
+        return f"{self.prefix}:lease:{key}"
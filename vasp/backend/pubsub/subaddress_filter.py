@@ -0,0 +1,96 @@
+# pyre-strict
+
+# Copyright (c) The Diem Core Contributors
+# SPDX-License-Identifier: Apache-2.0
+
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from merchant_vasp.storage import Payment, PaymentStatus, db_session
+from .types import LRWPubSubEvent
+
+logger = logging.getLogger(__name__)
+
+
+class OpenPaymentFilter:
+    """
+    In-memory set of subaddresses of payments still waiting to be paid.
+    Open payments expire within minutes, so the set stays small and is kept
+    exact instead of probabilistic: it is topped up from recently created
+    payments on every refresh and fully reloaded now and then.
+    While the set can not be loaded, every event is let through.
+    """
+
+    def __init__(self, config: Dict[str, Any]) -> None:
+        self.refresh_interval_ms: int = config.get("refresh_interval_ms", 0)
+        self.full_reload_interval_ms: int = config.get(
+            "full_reload_interval_ms", 300000
+        )
+        # Late events for just expired payments still go to the worker, which
+        # rejects the payment
+        self.expiry_grace = timedelta(
+            milliseconds=config.get("expiry_grace_ms", 600000)
+        )
+        # Creation timestamps are set before commit, so re-read a short
+        # window before the watermark to catch slow transactions
+        self.overlap = timedelta(milliseconds=config.get("overlap_ms", 60000))
+
+        self.expiry_dates: Dict[str, datetime] = {}
+        self.watermark: Optional[datetime] = None
+        self.loaded = False
+        self._last_refresh: Optional[float] = None
+        self._last_full_reload: Optional[float] = None
+
+    def refresh(self) -> None:
+        now = time.monotonic()
+        if (
+            self._last_refresh is not None
+            and (now - self._last_refresh) * 1000 < self.refresh_interval_ms
+        ):
+            return
+
+        full_reload = (
+            self._last_full_reload is None
+            or (now - self._last_full_reload) * 1000 >= self.full_reload_interval_ms
+        )
+        try:
+            self._load(full_reload)
+            self.loaded = True
+            if full_reload:
+                self._last_full_reload = now
+        except Exception as exc:
+            self.loaded = False
+            self._last_full_reload = None
+            logger.exception(f"failed to load open payment subaddresses: {exc}")
+        finally:
+            db_session.remove()
+        self._last_refresh = now
+
+    def _load(self, full_reload: bool) -> None:
+        query = Payment.query.with_entities(
+            Payment.subaddress, Payment.expiry_date, Payment.created_at
+        ).filter(Payment.status == PaymentStatus.created)
+        if not full_reload and self.watermark is not None:
+            query = query.filter(Payment.created_at > self.watermark - self.overlap)
+
+        expiry_dates = {} if full_reload else self.expiry_dates.copy()
+        watermark = None if full_reload else self.watermark
+        for subaddress, expiry_date, created_at in query:
+            expiry_dates[subaddress] = expiry_date
+            if watermark is None or created_at > watermark:
+                watermark = created_at
+
+        cutoff = datetime.utcnow() - self.expiry_grace
+        self.expiry_dates = {
+            subaddress: expiry_date
+            for subaddress, expiry_date in expiry_dates.items()
+            if expiry_date > cutoff
+        }
+        self.watermark = watermark
+
+    def may_match(self, event: LRWPubSubEvent) -> bool:
+        if not self.loaded:
+            return True
+        return event.receiver_sub_address in self.expiry_dates
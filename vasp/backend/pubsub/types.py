@@ -3,10 +3,34 @@
 # Copyright (c) The Diem Core Contributors
 # SPDX-License-Identifier: Apache-2.0
 
+import logging
+import struct
+from typing import Any, Dict, Optional
+
 from diem import diem_types, jsonrpc
 
+logger = logging.getLogger(__name__)
+
+# Wire format, version 1:
+#   header: wire version (u8), amount, version, sequence (u64 each, big endian)
+#   then sender, receiver, currency and raw metadata, each as u16 length + bytes
+_WIRE_VERSION = 1
+_HEADER = struct.Struct(">BQQQ")
+_LENGTH = struct.Struct(">H")
+
 
 class LRWPubSubEvent:
+    __slots__ = (
+        "sender",
+        "receiver",
+        "amount",
+        "currency",
+        "version",
+        "sequence",
+        "raw_metadata",
+        "_metadata",
+    )
+
     def __init__(
         self,
         sender: str,
@@ -23,14 +47,43 @@ class LRWPubSubEvent:
         self.currency = currency
         self.version = version
         self.sequence = sequence
+        self.raw_metadata = metadata
+        self._metadata: Optional[diem_types.Metadata] = None
 
-        # The metadata deserializer is totally a prickly drama queen
-        # It breaks on data directly from the blockchain without saying much
-        self.metadata = diem_types.Metadata__Undefined()
-        try:
-            self.metadata = diem_types.Metadata.lcs_deserialize(metadata)
-        except:
-            pass
+    @property
+    def metadata(self) -> diem_types.Metadata:
+        """Metadata decoded on first access; undefined if it can not be decoded"""
+        if self._metadata is None:
+            try:
+                self._metadata = diem_types.Metadata.bcs_deserialize(self.raw_metadata)
+            except Exception as exc:
+                # Plenty of chain transactions carry no or non-standard metadata
+                logger.debug(f"could not decode metadata of {self.version}: {exc}")
+                self._metadata = diem_types.Metadata__Undefined()
+        return self._metadata
+
+    @property
+    def general_metadata(self) -> Optional[diem_types.GeneralMetadataV0]:
+        metadata = self.metadata
+        if isinstance(metadata, diem_types.Metadata__GeneralMetadata) and isinstance(
+            metadata.value, diem_types.GeneralMetadata__GeneralMetadataVersion0
+        ):
+            return metadata.value.value
+        return None
+
+    @property
+    def sender_sub_address(self) -> Optional[str]:
+        general_metadata = self.general_metadata
+        if general_metadata and general_metadata.from_subaddress:
+            return general_metadata.from_subaddress.hex()
+        return None
+
+    @property
+    def receiver_sub_address(self) -> Optional[str]:
+        general_metadata = self.general_metadata
+        if general_metadata and general_metadata.to_subaddress:
+            return general_metadata.to_subaddress.hex()
+        return None
 
     @classmethod
     def from_jsonrpc_event(cls, event: jsonrpc.Event) -> "LRWPubSubEvent":
@@ -44,10 +97,62 @@ class LRWPubSubEvent:
             sequence=event.sequence_number,
         )
 
+    def to_bytes(self) -> bytes:
+        parts = [_HEADER.pack(_WIRE_VERSION, self.amount, self.version, self.sequence)]
+        for field in (
+            self.sender.encode(),
+            self.receiver.encode(),
+            self.currency.encode(),
+            self.raw_metadata,
+        ):
+            parts.append(_LENGTH.pack(len(field)))
+            parts.append(field)
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "LRWPubSubEvent":
+        wire_version, amount, version, sequence = _HEADER.unpack_from(data)
+        if wire_version != _WIRE_VERSION:
+            raise ValueError(f"Unsupported LRWPubSubEvent wire version {wire_version}")
+
+        fields = []
+        offset = _HEADER.size
+        for _ in range(4):
+            (length,) = _LENGTH.unpack_from(data, offset)
+            offset += _LENGTH.size
+            fields.append(data[offset : offset + length])
+            offset += length
+        sender, receiver, currency, metadata = fields
+
+        return LRWPubSubEvent(
+            sender=sender.decode(),
+            receiver=receiver.decode(),
+            amount=amount,
+            currency=currency.decode(),
+            metadata=metadata,
+            version=version,
+            sequence=sequence,
+        )
+
+    def __reduce__(self) -> Any:
+        # Queued messages are pickled, so pickle as the compact wire format
+        # instead of the object and its decoded metadata
+        return LRWPubSubEvent.from_bytes, (self.to_bytes(),)
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        # Messages queued before the wire format pickled the instance dict,
+        # with the metadata in decoded form
+        state = state.copy()
+        metadata = state.pop("metadata")
+        for name, value in state.items():
+            setattr(self, name, value)
+        self.raw_metadata = metadata.bcs_serialize()
+        self._metadata = metadata
+
     def __str__(self) -> str:
         """
         Print as a nested dict to str
         """
-        d = self.__dict__.copy()
+        d = {name: getattr(self, name) for name in self.__slots__[:6]}
         d["metadata"] = self.metadata.__dict__
         return str(d)
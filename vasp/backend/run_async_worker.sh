@@ -0,0 +1,3 @@
+#!/bin/bash
+
+python -m merchant_vasp.async_worker "$@"
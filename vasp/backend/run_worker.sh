@@ -1,4 +1,24 @@
 #!/bin/bash
 #export INIT_DRAMATIQ=1
 
-dramatiq merchant_vasp -p 2 -t 2 --verbose  "$@"
+# Bind the worker to some queues, e.g. one incoming_txn_<n> partition per
+# worker when PAYMENT_QUEUE_PARTITIONS is set, to keep each payment's events
+# on a single worker
+QUEUE_ARGS=()
+if [ -n "$WORKER_QUEUES" ]; then
+	QUEUE_ARGS=(-Q $WORKER_QUEUES)
+fi
+
+# A partition is only processed in order by a single thread, so a worker bound
+# to partitions runs one process with one thread, whatever PROCS and THREADS say
+case " $WORKER_QUEUES " in
+*" incoming_txn_"*)
+	if [ "${PROCS:-1}" != 1 ] || [ "${THREADS:-1}" != 1 ]; then
+		echo "Bound to payment partitions, running 1 process with 1 thread" >&2
+	fi
+	PROCS=1
+	THREADS=1
+	;;
+esac
+
+dramatiq merchant_vasp -p "${PROCS:-2}" -t "${THREADS:-2}" --verbose "${QUEUE_ARGS[@]}" "$@"
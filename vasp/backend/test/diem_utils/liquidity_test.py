@@ -0,0 +1,84 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from uuid import uuid4
+
+from diem_utils.sdks.liquidity import CachingLpClient, LpClient
+from diem_utils.types.liquidity.currency import CurrencyPairs
+from diem_utils.types.liquidity.quote import QuoteData, Rate
+from test.conftest import MOCK_LP_DETAILS
+
+PAIR = CurrencyPairs.XUS_USD.value
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def quote(rate, expires_at):
+    return QuoteData(
+        quote_id=uuid4(),
+        rate=Rate(pair=CurrencyPairs.XUS_USD, rate=rate),
+        expires_at=datetime.fromtimestamp(expires_at, timezone.utc),
+        amount=100,
+    )
+
+
+def test_rate_is_reused_until_shortly_before_the_quote_expires(mocker):
+    clock = Clock()
+    get_quote = mocker.patch.object(
+        LpClient, "get_quote", side_effect=[quote(1, 1030), quote(2, 1060)]
+    )
+    client = CachingLpClient(expiry_margin_s=5, clock=clock)
+
+    assert client.get_rate(PAIR, 100).rate == 1
+    clock.now = 1024
+    assert client.get_rate(PAIR, 200).rate == 1
+    assert get_quote.call_count == 1
+
+    clock.now = 1025
+    assert client.get_rate(PAIR, 100).rate == 2
+    assert get_quote.call_count == 2
+
+
+def test_lp_details_are_cached_for_their_ttl(mocker):
+    clock = Clock()
+    lp_details = mocker.patch.object(
+        LpClient, "lp_details", return_value=MOCK_LP_DETAILS
+    )
+    client = CachingLpClient(details_ttl_s=60, clock=clock)
+
+    assert client.lp_details() == MOCK_LP_DETAILS
+    clock.now += 59
+    client.lp_details()
+    assert lp_details.call_count == 1
+
+    clock.now += 1
+    client.lp_details()
+    assert lp_details.call_count == 2
+
+
+def test_concurrent_callers_share_one_request(mocker):
+    release = threading.Event()
+    calls = []
+
+    def slow_quote(pair, amount, timeout=None):
+        calls.append(pair)
+        release.wait(5)
+        return quote(1, 2000)
+
+    client = CachingLpClient(clock=Clock())
+    mocker.patch.object(client, "get_quote", side_effect=slow_quote)
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        rates = [executor.submit(client.get_rate, PAIR, 100) for _ in range(4)]
+        while not calls:
+            pass
+        release.set()
+
+    assert [rate.result().rate for rate in rates] == [1] * 4
+    assert len(calls) == 1
@@ -0,0 +1,84 @@
+import asyncio
+from concurrent.futures import Executor, Future
+
+import dramatiq
+from dramatiq.brokers.stub import StubBroker
+from dramatiq.middleware import Retries
+
+from merchant_vasp import async_worker, payment_service
+from merchant_vasp.async_worker import AsyncWorker
+from merchant_vasp.dead_letters import DeadLetters, DeadLetterStore
+from merchant_vasp.payment_service import PaymentServiceException
+from merchant_vasp.onchainwallet import OnchainWallet
+from merchant_vasp.storage import Payment, PaymentStatus
+from test.conftest import PAYMENT_ID, PAYMENT_SUBADDR
+from test.merchant_vasp.dead_letters_test import FakeRedis
+from test.pubsub.subaddress_filter_test import make_lrw_event
+
+
+class InlineExecutor(Executor):
+    """Runs work on the event loop thread, which owns the in-memory test database"""
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+        return future
+
+
+def run_until_processed(worker, broker):
+    async def run():
+        task = asyncio.ensure_future(worker.run())
+        await asyncio.get_event_loop().run_in_executor(None, broker.join, "default")
+        worker.stop()
+        await task
+
+    asyncio.new_event_loop().run_until_complete(run())
+
+
+def test_async_worker_clears_incoming_payments_in_a_batch(db, monkeypatch):
+    broker = StubBroker()
+    store = DeadLetterStore(FakeRedis())
+    broker.add_middleware(DeadLetters(store), before=Retries)
+    txn_actor = dramatiq.actor(
+        lambda txn: None,
+        broker=broker,
+        actor_name="process_incoming_txn",
+        throws=(PaymentServiceException,),
+    )
+    unmatched = []
+
+    @dramatiq.actor(broker=broker, actor_name="record_unmatched_txn")
+    def unmatched_actor(txn):
+        unmatched.append(txn)
+
+    batches = []
+
+    def process_incoming_transactions(transactions):
+        batches.append(transactions)
+        return payment_service.process_incoming_transactions(transactions)
+
+    monkeypatch.setattr(
+        async_worker, "process_incoming_transactions", process_incoming_transactions
+    )
+
+    event = make_lrw_event(PAYMENT_SUBADDR)
+    event.receiver = OnchainWallet().address_str
+    unknown_payment = make_lrw_event("1234567812345678")
+    for txn in (event, unknown_payment, event):
+        txn_actor.send(txn)
+    unmatched_actor.send("unmatched")
+
+    run_until_processed(AsyncWorker(broker, executor=InlineExecutor()), broker)
+
+    assert [len(batch) for batch in batches] == [3]
+    assert unmatched == ["unmatched"]
+    assert Payment.query.get(PAYMENT_ID).status == PaymentStatus.cleared
+    # The unknown payment and the second event for the cleared one are rejected
+    assert len(broker.dead_letters) == 2
+    rejected = [d.to_message().args[0].receiver_sub_address for d in store.list()]
+    assert sorted(rejected) == sorted(
+        [unknown_payment.receiver_sub_address, PAYMENT_SUBADDR]
+    )
@@ -0,0 +1,84 @@
+import threading
+
+import pytest
+
+from merchant_vasp.cache import CachedValue
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_value_is_loaded_once_while_fresh():
+    loads = []
+    clock = Clock()
+    cache = CachedValue(lambda: loads.append(1) or len(loads), ttl_s=10, clock=clock)
+
+    assert cache.get() == 1
+    clock.now = 9
+    assert cache.get() == 1
+    assert len(loads) == 1
+
+
+def test_stale_value_is_served_while_refreshing():
+    clock = Clock()
+    refreshing = threading.Event()
+    values = iter(["first", "second"])
+
+    def load():
+        value = next(values)
+        if value == "second":
+            refreshing.wait(5)
+        return value
+
+    cache = CachedValue(load, ttl_s=10, clock=clock)
+    assert cache.get() == "first"
+
+    clock.now = 11
+    assert cache.get() == "first"
+    # Only one refresh runs at a time
+    assert cache.get() == "first"
+    refreshing.set()
+    cache.wait_for_refresh(5)
+    assert cache.get() == "second"
+
+
+def test_failed_refresh_keeps_last_good_value():
+    clock = Clock()
+    results = iter(["good", ConnectionError("node down"), "better"])
+
+    def load():
+        result = next(results)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    cache = CachedValue(load, ttl_s=10, retry_interval_s=2, clock=clock)
+    assert cache.get() == "good"
+
+    clock.now = 11
+    assert cache.get() == "good"
+    cache.wait_for_refresh(5)
+    clock.now = 12
+    # No new attempt before the retry interval
+    assert cache.get() == "good"
+    cache.wait_for_refresh(5)
+
+    clock.now = 13
+    cache.get()
+    cache.wait_for_refresh(5)
+    assert cache.get() == "better"
+
+
+def test_first_load_failure_is_raised():
+    def load():
+        raise ConnectionError("node down")
+
+    cache = CachedValue(load, ttl_s=10)
+
+    with pytest.raises(ConnectionError):
+        cache.get()
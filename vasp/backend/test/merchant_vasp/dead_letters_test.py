@@ -0,0 +1,159 @@
+import runpy
+import sys
+
+import dramatiq
+from diem import jsonrpc
+from dramatiq.brokers.stub import StubBroker
+from dramatiq.middleware import Retries
+from sqlalchemy import exc as sa_exc
+
+from merchant_vasp import dead_letters
+from merchant_vasp.background_tasks import record_unmatched_txn
+from merchant_vasp.dead_letters import (
+    DeadLetters,
+    DeadLetterStore,
+    get_dead_letter_store,
+    is_transient,
+    retry_when,
+    MAX_TRANSIENT_RETRIES,
+)
+from merchant_vasp.payment_service import PaymentServiceException
+from test.pubsub.subaddress_filter_test import make_lrw_event
+
+
+class FakeRedis:
+    """The few hash commands the dead letter store uses"""
+
+    def __init__(self):
+        self.hashes = {}
+
+    def hset(self, key, field, value):
+        self.hashes.setdefault(key, {})[field.encode()] = value.encode()
+
+    def hget(self, key, field):
+        return self.hashes.get(key, {}).get(field.encode())
+
+    def hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+    def hlen(self, key):
+        return len(self.hashes.get(key, {}))
+
+    def hdel(self, key, *fields):
+        values = self.hashes.get(key, {})
+        return sum(values.pop(field.encode(), None) is not None for field in fields)
+
+
+def make_broker():
+    store = DeadLetterStore(FakeRedis())
+    broker = StubBroker(
+        middleware=[DeadLetters(store), Retries(min_backoff=1, retry_when=retry_when)]
+    )
+    return broker, store
+
+
+def process(broker, actor, *args):
+    worker = dramatiq.Worker(broker, worker_threads=1, worker_timeout=100)
+    worker.start()
+    actor.send(*args)
+    broker.join(actor.queue_name)
+    worker.join()
+    worker.stop()
+
+
+def test_retry_only_transient_errors():
+    operational = sa_exc.OperationalError("SELECT 1", {}, Exception("gone away"))
+
+    assert is_transient(operational)
+    assert is_transient(jsonrpc.NetworkError("refused"))
+    assert not is_transient(PaymentServiceException("expired"))
+    assert not is_transient(ValueError())
+    assert retry_when(0, operational)
+    assert not retry_when(MAX_TRANSIENT_RETRIES, operational)
+    assert not retry_when(0, KeyError("XYZ"))
+
+
+def test_permanent_failures_are_dead_lettered_at_once():
+    broker, store = make_broker()
+    calls = []
+
+    @dramatiq.actor(broker=broker)
+    def rejects(value):
+        calls.append(value)
+        raise PaymentServiceException("expired")
+
+    process(broker, rejects, "event")
+
+    assert calls == ["event"]
+    [dead_letter] = store.list()
+    assert dead_letter.actor_name == "rejects"
+    assert dead_letter.queue_name == "default"
+    assert "expired" in dead_letter.reason
+    assert "PaymentServiceException" in dead_letter.traceback
+    assert dead_letter.to_message().args == ("event",)
+
+
+def test_transient_failures_are_retried():
+    broker, store = make_broker()
+    calls = []
+
+    @dramatiq.actor(broker=broker)
+    def flaky(value):
+        calls.append(value)
+        if len(calls) < 3:
+            raise jsonrpc.NetworkError("refused")
+
+    process(broker, flaky, "event")
+
+    assert calls == ["event"] * 3
+    assert store.list() == []
+
+
+def test_redrive_sends_first_attempts_to_the_original_queue():
+    broker, store = make_broker()
+    actor = dramatiq.actor(lambda value: None, broker=broker, actor_name="act")
+    broker.declare_queue("incoming_txn_1")
+    message = actor.message("a").copy(queue_name="incoming_txn_1")
+    message.options["retries"] = 10
+    store.add(message, "KeyError('XYZ')")
+    store.add(actor.message("b"), "KeyError('XYZ')")
+
+    assert store.count() == 2
+    assert store.redrive(broker, store.list(actor_name="act")[:1]) == 1
+
+    [redriven] = broker.queues["incoming_txn_1"].queue
+    redriven = dramatiq.Message.decode(redriven)
+    assert redriven.args == ("a",)
+    assert "retries" not in redriven.options
+    assert [d.to_message().args for d in store.list()] == [("b",)]
+    assert store.delete([d.message_id for d in store.list()]) == 1
+    assert store.count() == 0
+
+
+def test_unmatched_events_are_dead_lettered(monkeypatch):
+    store = DeadLetterStore(FakeRedis())
+    monkeypatch.setattr(dead_letters, "get_dead_letter_store", lambda: store)
+    txn = make_lrw_event("1234567812345678")
+
+    record_unmatched_txn(txn)
+
+    [dead_letter] = store.list()
+    assert dead_letter.actor_name == "process_incoming_txn"
+    assert "1234567812345678" in dead_letter.reason
+    [redriven] = dead_letter.to_message().args
+    assert redriven.receiver_sub_address == txn.receiver_sub_address
+
+
+def test_cli_run_as_a_module_uses_the_broker_store(monkeypatch, capsys):
+    store = get_dead_letter_store()
+    monkeypatch.setattr(store, "client", FakeRedis())
+    message = dramatiq.Message(
+        queue_name="default", actor_name="act", args=(), kwargs={}, options={}
+    )
+    store.add(message, "rejected")
+    monkeypatch.setattr(sys, "argv", ["dead_letters_cli", "list"])
+
+    # What `python -m merchant_vasp.dead_letters_cli list` runs
+    runpy.run_module("merchant_vasp.dead_letters_cli", run_name="__main__")
+
+    assert message.message_id in capsys.readouterr().out
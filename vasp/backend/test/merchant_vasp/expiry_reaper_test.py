@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock
+
+from merchant_vasp.expiry_reaper import ExpiryReaper, REAPER_SLOT_KEY
+from merchant_vasp.payment_service import reject_expired_payments
+from merchant_vasp.storage import Payment, PaymentStatus
+from merchant_vasp.storage.models import PaymentStatusLog
+from test.conftest import EXPIRED_PAYMENT_ID, PAYMENT_ID
+
+
+def add_expired_payments(db, count):
+    merchant_id = db.query(Payment).get(PAYMENT_ID).merchant_id
+    for i in range(count):
+        db.add(
+            Payment(
+                merchant_id=merchant_id,
+                merchant_reference_id=f"expired-{i}",
+                requested_amount=100,
+                requested_currency="USD",
+                subaddress=f"{i:016x}",
+                expiry_date=datetime.utcnow() - timedelta(minutes=i + 1),
+            )
+        )
+    db.commit()
+
+
+def statuses(db):
+    db.remove()
+    return {payment.id: payment.status for payment in db.query(Payment)}
+
+
+def test_expired_payments_are_rejected_in_batches(db):
+    add_expired_payments(db, 4)
+    before = statuses(db)
+
+    assert reject_expired_payments(batch_size=2) == 5
+
+    after = statuses(db)
+    assert after[PAYMENT_ID] == PaymentStatus.created
+    assert after[EXPIRED_PAYMENT_ID] == PaymentStatus.rejected
+    rejected = [
+        payment_id
+        for payment_id, status in before.items()
+        if status == PaymentStatus.created and after[payment_id] != status
+    ]
+    assert len(rejected) == 5
+    assert all(after[payment_id] == PaymentStatus.rejected for payment_id in rejected)
+    logs = PaymentStatusLog.query.filter(
+        PaymentStatusLog.payment_id.in_(rejected),
+        PaymentStatusLog.status == PaymentStatus.rejected,
+    )
+    assert sorted(log.payment_id for log in logs) == sorted(rejected)
+
+    assert reject_expired_payments(batch_size=2) == 0
+
+
+def test_one_process_reaps_per_round(db):
+    broker = MagicMock()
+    broker.client.set.side_effect = [True, False]
+    reaper = ExpiryReaper(interval_s=30, batch_size=10)
+
+    assert reaper.reap(broker) == 1
+    assert reaper.reap(broker) == 0
+
+    args, kwargs = broker.client.set.call_args
+    assert args == (REAPER_SLOT_KEY, 1)
+    assert kwargs == dict(nx=True, px=30000)
@@ -0,0 +1,93 @@
+import time
+from unittest.mock import MagicMock
+
+import dramatiq
+from dramatiq.brokers.redis import RedisBroker
+from dramatiq.brokers.stub import StubBroker
+from dramatiq.middleware.prometheus import DB_PATH
+
+from merchant_vasp.async_worker import AsyncWorker
+from merchant_vasp.metrics import WorkerMetrics
+from test.merchant_vasp.async_worker_test import InlineExecutor, run_until_processed
+
+
+def boot(metrics, broker, monkeypatch):
+    # Restored after the test; metrics of this process are not multiprocess
+    monkeypatch.setenv("prometheus_multiproc_dir", DB_PATH)
+    broker.add_middleware(metrics)
+    broker.emit_after("process_boot")
+
+
+def test_busy_time_and_wait_are_recorded(monkeypatch):
+    broker = StubBroker(middleware=[])
+    metrics = WorkerMetrics()
+    boot(metrics, broker, monkeypatch)
+
+    @dramatiq.actor(broker=broker)
+    def slow():
+        time.sleep(0.05)
+
+    worker = dramatiq.Worker(broker, worker_threads=1, worker_timeout=100)
+    worker.start()
+    for _ in range(3):
+        slow.send()
+    broker.join(slow.queue_name)
+    worker.join()
+    worker.stop()
+
+    registry = metrics.registry
+    assert registry.get_sample_value("lrm_worker_threads") == 1
+    assert registry.get_sample_value("lrm_worker_busy_seconds_total") >= 0.15
+    labels = {"queue_name": "default", "actor_name": "slow"}
+    assert registry.get_sample_value("lrm_message_wait_seconds_count", labels) == 3
+
+
+def test_async_worker_reports_the_threads_of_its_pool(monkeypatch):
+    broker = StubBroker(middleware=[])
+    metrics = WorkerMetrics()
+    boot(metrics, broker, monkeypatch)
+    broker.declare_queue("default")
+
+    worker = AsyncWorker(broker, threads=3, executor=InlineExecutor())
+    run_until_processed(worker, broker)
+
+    assert metrics.registry.get_sample_value("lrm_worker_threads") == 3
+
+
+def test_sample_queues_reports_depth_and_age(monkeypatch):
+    redis_client = MagicMock()
+    pipeline = redis_client.pipeline.return_value
+    broker = RedisBroker(client=redis_client, middleware=[], namespace="lrm")
+    metrics = WorkerMetrics()
+    boot(metrics, broker, monkeypatch)
+    broker.declare_queue("default")
+    broker.declare_queue("incoming_txn_0")
+
+    message = dramatiq.Message(
+        queue_name="default",
+        actor_name="act",
+        args=(),
+        kwargs={},
+        options={},
+        message_timestamp=int(time.time() * 1000) - 30_000,
+    )
+    pipeline.execute.side_effect = [[4, 1, b"head", 0, 2, None], [message.encode()]]
+
+    metrics.sample_queues(broker)
+
+    assert pipeline.lindex.call_args_list[0][0] == ("lrm:default", 0)
+    assert pipeline.hget.call_args[0] == ("lrm:default.msgs", b"head")
+    registry = metrics.registry
+    sample = lambda name, **labels: registry.get_sample_value(name, labels)
+    assert sample("lrm_queue_messages", queue_name="default", state="ready") == 4
+    assert sample("lrm_queue_messages", queue_name="default", state="delayed") == 1
+    assert sample("lrm_queue_messages", queue_name="incoming_txn_0", state="ready") == 0
+    assert (
+        sample("lrm_queue_messages", queue_name="incoming_txn_0", state="delayed") == 2
+    )
+    assert (
+        29 < sample("lrm_queue_oldest_message_age_seconds", queue_name="default") < 60
+    )
+    assert (
+        sample("lrm_queue_oldest_message_age_seconds", queue_name="incoming_txn_0") == 0
+    )
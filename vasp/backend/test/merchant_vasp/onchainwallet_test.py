@@ -0,0 +1,28 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from merchant_vasp import onchainwallet
+from merchant_vasp.onchainwallet import get_wallet, OnchainWallet
+
+
+def test_wallet_is_created_once_per_process(monkeypatch):
+    monkeypatch.setattr(onchainwallet, "_wallets", {})
+    created = []
+    barrier = threading.Barrier(8)
+
+    class CountingWallet(OnchainWallet):
+        def __init__(self, *args):
+            created.append(self)
+            super().__init__(*args)
+
+    def wallet(_):
+        barrier.wait()
+        return get_wallet()
+
+    monkeypatch.setattr(onchainwallet, "OnchainWallet", CountingWallet)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        wallets = list(executor.map(wallet, range(8)))
+
+    assert len(created) == 1
+    assert all(w is created[0] for w in wallets)
+    assert get_wallet().address_str == OnchainWallet().address_str
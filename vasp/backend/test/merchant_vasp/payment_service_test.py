@@ -1,9 +1,10 @@
 import pytest
+from sqlalchemy import event
 from diem_utils.types.currencies import DEFAULT_DIEM_CURRENCY
 
 from merchant_vasp import payment_service
 from merchant_vasp.onchainwallet import OnchainWallet
-from merchant_vasp.storage import Payment, PaymentStatus
+from merchant_vasp.storage import Payment, PaymentStatus, engine
 from test.conftest import (
     REJECTED_PAYMENT_SUBADDR,
     SENDER_MOCK_ADDR,
@@ -136,3 +137,88 @@ def test_successful_payment(db):
     payment = db.query(Payment).filter(Payment.id == PAYMENT_ID).one()
     assert payment.status == PaymentStatus.cleared
     assert payment.get_chain_transaction(payment_version) is not None
+
+
+def test_payment_is_cleared_with_a_single_query(db):
+    db.remove()
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement.split()[0])
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        payment_service.process_incoming_transaction(
+            **incoming_transaction(PAYMENT_SUBADDR, 808)
+        )
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+    # The locked lookup, then the writes flushed by the single commit
+    assert statements == ["SELECT", "UPDATE", "INSERT", "INSERT"]
+    db.remove()
+    payment = Payment.find_by_subaddress(PAYMENT_SUBADDR)
+    assert payment.status == PaymentStatus.cleared
+    assert [log.status for log in payment.payment_status_logs] == [
+        PaymentStatus.created,
+        PaymentStatus.cleared,
+    ]
+
+
+def incoming_transaction(receiver_sub_address, version, amount=PAYMENT_AMOUNT):
+    return dict(
+        sender_address=SENDER_MOCK_ADDR,
+        sender_sub_address=SENDER_MOCK_SUBADDR,
+        receiver_address=OnchainWallet().address_str,
+        receiver_sub_address=receiver_sub_address,
+        amount=amount,
+        currency=PAYMENT_CURRENCY,
+        version=version,
+    )
+
+
+def test_batch_of_payments_is_cleared_per_event(db):
+    results = payment_service.process_incoming_transactions(
+        [
+            incoming_transaction("ffffffffffffffff", 1),
+            incoming_transaction(PAYMENT_SUBADDR, 2, amount=PAYMENT_AMOUNT - 1),
+            incoming_transaction(PAYMENT_SUBADDR, 3),
+            incoming_transaction(PAYMENT_SUBADDR, 4),
+            incoming_transaction(EXPIRED_PAYMENT_SUBADDR, 5),
+        ]
+    )
+
+    assert [type(result) for result in results] == [
+        payment_service.PaymentForSubaddrNotFoundException,
+        payment_service.PaymentOptionNotFoundException,
+        type(None),
+        payment_service.PaymentStatusException,
+        payment_service.PaymentExpiredException,
+    ]
+    db.remove()
+    payment = db.query(Payment).filter(Payment.id == PAYMENT_ID).one()
+    assert payment.status == PaymentStatus.cleared
+    assert payment.get_chain_transaction(3) is not None
+    expired = Payment.find_by_subaddress(EXPIRED_PAYMENT_SUBADDR)
+    assert expired.status == PaymentStatus.rejected
+
+
+def test_batch_falls_back_to_single_events_if_commit_fails(db, monkeypatch):
+    commit = db.commit
+    calls = []
+
+    def failing_first_commit():
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError("deadlock")
+        commit()
+
+    monkeypatch.setattr(db, "commit", failing_first_commit)
+
+    results = payment_service.process_incoming_transactions(
+        [incoming_transaction(PAYMENT_SUBADDR, 3)]
+    )
+
+    assert results == [None]
+    payment = db.query(Payment).filter(Payment.id == PAYMENT_ID).one()
+    assert payment.status == PaymentStatus.cleared
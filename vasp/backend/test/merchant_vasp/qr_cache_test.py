@@ -0,0 +1,56 @@
+import base64
+import time
+
+import pyqrcode
+
+from merchant_vasp.payment_service import qr_cache
+from merchant_vasp.payment_service.qr_cache import QrCache, QrImage
+
+LINK = "diem://tdm1p7ujcndcl7nudzwt8fglhx6wxn08kgs5tm6mz4usw5p72t?c=XUS&am=8120000"
+
+
+def test_images_are_rendered_once_per_link_and_scale():
+    cache = QrCache(max_entries=10)
+
+    image = cache.image(LINK, 10)
+
+    assert image.startswith(b"\x89PNG")
+    assert cache.image(LINK, 10) is image
+    assert cache.image(LINK, 4) is not image
+    assert cache.image(LINK, 10, "svg").startswith(b"<?xml")
+    assert len(cache) == 3
+
+
+def test_least_recently_used_image_is_dropped():
+    cache = QrCache(max_entries=2)
+    first, second, third = (f"{LINK}&n={i}" for i in range(3))
+
+    cache.image(first, 10)
+    cache.image(second, 10)
+    cache.image(first, 10)
+    cache.image(third, 10)
+
+    assert QrCache.key(first, 10) in cache
+    assert QrCache.key(second, 10) not in cache
+    assert QrCache.key(third, 10) in cache
+
+
+def test_image_matches_direct_rendering():
+    expected = pyqrcode.create(LINK).png_as_base64_str(scale=10)
+
+    image = QrImage(LINK, "png", 10)
+
+    assert base64.b64encode(image.render()).decode() == expected
+    assert image.etag == QrCache.key(LINK, 10, "png")
+    assert image.mimetype == "image/png"
+
+
+def test_prerendered_images_end_up_in_the_shared_cache():
+    link = f"{LINK}&prerendered"
+
+    qr_cache.prerender([link], 10)
+
+    deadline = time.monotonic() + 5
+    while QrCache.key(link, 10) not in qr_cache.qr_cache:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
@@ -0,0 +1,76 @@
+import threading
+import time
+
+import pytest
+
+from merchant_vasp import payment_service, transaction_manager
+from merchant_vasp.fiat_liquidity_wrapper import FiatLiquidityWrapper
+from merchant_vasp.storage import Merchant
+
+QUOTE_CURRENCIES = ("XUS", "XDX", "ABC")
+
+
+@pytest.fixture()
+def quotes(db, monkeypatch):
+    """Quote prices per currency; an exception is raised, an event waited on"""
+    prices = {}
+    monkeypatch.setattr(
+        payment_service, "get_supported_network_currencies", lambda: QUOTE_CURRENCIES
+    )
+
+    def quote_price(self, quote_currency, amount, timeout=None):
+        assert timeout == transaction_manager.QUOTE_TIMEOUT_S
+        price = prices[quote_currency]
+        if isinstance(price, Exception):
+            raise price
+        if isinstance(price, threading.Event):
+            price.wait(5)
+            return 0
+        time.sleep(0.1)
+        return price
+
+    monkeypatch.setattr(FiatLiquidityWrapper, "quote_price", quote_price)
+    return prices
+
+
+def create_payment(db):
+    merchant = db.query(Merchant).first()
+    return transaction_manager.create_payment("USD", "quoted", 100, merchant.id)
+
+
+def options(payment):
+    return [(option.currency, option.amount) for option in payment.payment_options]
+
+
+def test_currencies_are_quoted_concurrently(db, quotes):
+    quotes.update(XUS=101, XDX=102, ABC=103)
+
+    start = time.monotonic()
+    payment = create_payment(db)
+
+    assert time.monotonic() - start < 0.25
+    assert options(payment) == [("XUS", 101), ("XDX", 102), ("ABC", 103)]
+
+
+def test_failed_and_late_quotes_are_left_out(db, quotes, monkeypatch):
+    monkeypatch.setattr(transaction_manager, "QUOTE_DEADLINE_S", 0.5)
+    late = threading.Event()
+    quotes.update(XUS=101, XDX=ConnectionError("lp down"), ABC=late)
+
+    try:
+        payment = create_payment(db)
+    finally:
+        late.set()
+
+    assert options(payment) == [("XUS", 101)]
+
+
+def test_payment_is_not_created_without_quotes(db, quotes):
+    quotes.update(
+        XUS=ConnectionError("lp down"),
+        XDX=ConnectionError("lp down"),
+        ABC=ConnectionError("lp down"),
+    )
+
+    with pytest.raises(ConnectionError):
+        create_payment(db)
@@ -0,0 +1,67 @@
+import google.protobuf.json_format as parser
+import pytest
+from diem import jsonrpc
+
+from pubsub.batch_rpc import BatchClient
+from test.pubsub.client_test import KEY_1, KEY_2, make_event
+
+
+class FakeResponse:
+    def __init__(self, body):
+        self.body = body
+        self.text = str(body)
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.body
+
+
+class FakeSession:
+    def __init__(self, handler):
+        self.handler = handler
+        self.requests = []
+
+    def post(self, url, json, timeout):
+        self.requests.append(json)
+        return FakeResponse(self.handler(json))
+
+
+def to_result(event):
+    return parser.MessageToDict(event, preserving_proto_field_name=True)
+
+
+def test_batch_fetches_all_keys_in_one_request():
+    events = {KEY_1: [make_event(KEY_1, i) for i in range(3)], KEY_2: []}
+
+    def handler(request):
+        responses = []
+        for call in request:
+            key, start, limit = call["params"]
+            if key == KEY_2:
+                responses.append(
+                    {"jsonrpc": "2.0", "id": call["id"], "error": {"code": -32602}}
+                )
+                continue
+            page = [to_result(e) for e in events[key][start : start + limit]]
+            responses.append({"jsonrpc": "2.0", "id": call["id"], "result": page})
+        return list(reversed(responses))
+
+    session = FakeSession(handler)
+    client = BatchClient("http://localhost:8080", session=session)
+
+    pages = client.get_events({KEY_1: (1, 10), KEY_2: (0, 10)})
+
+    assert len(session.requests) == 1
+    assert [e.sequence_number for e in pages[KEY_1]] == [1, 2]
+    assert isinstance(pages[KEY_2], jsonrpc.JsonRpcError)
+
+
+def test_batch_rejects_non_batch_response():
+    client = BatchClient(
+        "http://localhost:8080", session=FakeSession(lambda request: {"error": {}})
+    )
+
+    with pytest.raises(jsonrpc.InvalidServerResponse):
+        client.get_events({KEY_1: (0, 10)})
@@ -0,0 +1,402 @@
+import threading
+import time
+from unittest.mock import MagicMock
+
+import dramatiq
+import pytest
+from diem import jsonrpc, txnmetadata
+from dramatiq.brokers.stub import StubBroker
+from prometheus_client import REGISTRY
+
+from pubsub.client import LRWPubSubClient
+from pubsub.progress import BufferedProgressStorage
+from pubsub.sharding import KeyLeases
+from test.conftest import (
+    FAKE_WALLET_VASP_ADDR,
+    PAYMENT_AMOUNT,
+    PAYMENT_CURRENCY,
+    SENDER_MOCK_ADDR,
+)
+
+KEY_1 = "0" * 16 + "1" * 32
+KEY_2 = "0" * 16 + "2" * 32
+VERSION_OFFSETS = {KEY_1: 1000, KEY_2: 2000}
+
+
+class FakeDiemClient:
+    def __init__(self, events_per_key, delay_s=0):
+        self.events_per_key = events_per_key
+        self.delay_s = delay_s
+        self.ledger_version = 1
+        self.calls = []
+
+    def get_metadata(self):
+        return jsonrpc.Metadata(version=self.ledger_version)
+
+    def get_events(self, key, start, limit):
+        self.calls.append((key, start, limit))
+        time.sleep(self.delay_s)
+        return self.events_per_key.get(key, [])[start : start + limit]
+
+
+class FakeBatchClient:
+    def __init__(self, diem_client):
+        self.diem_client = diem_client
+        self.batches = []
+
+    def get_events(self, pages):
+        self.batches.append(pages)
+        return {
+            key: self.diem_client.get_events(key, start, limit)
+            for key, (start, limit) in pages.items()
+        }
+
+
+class FakeProcessor:
+    def __init__(self):
+        self.sent = []
+        self._lock = threading.Lock()
+
+    def send(self, event):
+        with self._lock:
+            self.sent.append(event)
+
+
+def make_event(key, sequence_number):
+    return jsonrpc.Event(
+        key=key,
+        sequence_number=sequence_number,
+        transaction_version=VERSION_OFFSETS[key] + sequence_number,
+        data=jsonrpc.EventData(
+            type="receivedpayment",
+            amount=jsonrpc.Amount(amount=PAYMENT_AMOUNT, currency=PAYMENT_CURRENCY),
+            sender=SENDER_MOCK_ADDR,
+            receiver=FAKE_WALLET_VASP_ADDR,
+            metadata="",
+        ),
+    )
+
+
+def make_client(tmp_path, fake_client, **config):
+    client = LRWPubSubClient(
+        {
+            "diem_node_uri": "http://localhost:8080",
+            "sync_interval_ms": 0,
+            "progress_file_path": str(tmp_path / "progress"),
+            "accounts": [],
+            "processor": FakeProcessor(),
+            **config,
+        }
+    )
+    client.client = fake_client
+    return client
+
+
+@pytest.mark.parametrize("sync_concurrency", [1, 4])
+def test_sync_keeps_per_key_order(tmp_path, sync_concurrency):
+    events = {
+        KEY_1: [make_event(KEY_1, i) for i in range(3)],
+        KEY_2: [make_event(KEY_2, i) for i in range(5)],
+    }
+    client = make_client(
+        tmp_path, FakeDiemClient(events), sync_concurrency=sync_concurrency
+    )
+
+    state = client.sync({KEY_1: 0, KEY_2: 2})
+
+    assert state == {KEY_1: 3, KEY_2: 5}
+    assert client.progress.fetch_state() == state
+    sent = client.processor.sent
+    assert [e.sequence for e in sent if e.version < 2000] == [0, 1, 2]
+    assert [e.sequence for e in sent if e.version >= 2000] == [2, 3, 4]
+
+
+def test_batched_sync_fetches_all_keys_at_once(tmp_path):
+    events = {
+        KEY_1: [make_event(KEY_1, i) for i in range(3)],
+        KEY_2: [make_event(KEY_2, i) for i in range(5)],
+    }
+    fake_client = FakeDiemClient(events)
+    client = make_client(tmp_path, fake_client, sync_concurrency=2)
+    client.batch_client = FakeBatchClient(fake_client)
+
+    state = client.sync({KEY_1: 0, KEY_2: 2})
+
+    assert state == {KEY_1: 3, KEY_2: 5}
+    assert client.batch_client.batches == [{KEY_1: (0, 10), KEY_2: (2, 10)}]
+    assert [e.sequence for e in client.processor.sent if e.version >= 2000] == [
+        2,
+        3,
+        4,
+    ]
+
+
+def test_concurrent_sync_overlaps_fetches(tmp_path):
+    events = {KEY_1: [make_event(KEY_1, 0)], KEY_2: [make_event(KEY_2, 0)]}
+    client = make_client(
+        tmp_path, FakeDiemClient(events, delay_s=0.2), sync_concurrency=2
+    )
+
+    started = time.monotonic()
+    client.sync({KEY_1: 0, KEY_2: 0})
+
+    assert time.monotonic() - started < 0.35
+
+
+def test_sync_failure_keeps_key_progress(tmp_path):
+    class BrokenDiemClient(FakeDiemClient):
+        def get_events(self, key, start, limit):
+            if key == KEY_2:
+                raise jsonrpc.NetworkError("down")
+            return super().get_events(key, start, limit)
+
+    events = {KEY_1: [make_event(KEY_1, 0)]}
+    client = make_client(tmp_path, BrokenDiemClient(events), sync_concurrency=2)
+
+    assert client.sync({KEY_1: 0, KEY_2: 7}, catch_error=True) == {KEY_1: 1, KEY_2: 7}
+    with pytest.raises(jsonrpc.NetworkError):
+        client.sync({KEY_1: 1, KEY_2: 7})
+
+
+def test_batch_size_grows_during_backlog_and_resets_at_head(tmp_path):
+    events = {KEY_1: [make_event(KEY_1, i) for i in range(10)]}
+    fake_client = FakeDiemClient(events)
+    client = make_client(
+        tmp_path,
+        fake_client,
+        sync_strategy_config={"batch_size": 2, "max_batch_size": 4},
+    )
+
+    state = {KEY_1: 0}
+    for _ in range(3):
+        state = client.sync(state)
+        assert client.catching_up
+
+    state = client.sync(state)
+
+    assert state == {KEY_1: 10}
+    assert [limit for _, _, limit in fake_client.calls] == [2, 4, 4, 4]
+    assert not client.catching_up
+    assert client.batch_sizes[KEY_1] == 2
+
+
+def test_sync_skips_keys_when_ledger_did_not_move(tmp_path):
+    events = {KEY_1: [make_event(KEY_1, 0)], KEY_2: []}
+    fake_client = FakeDiemClient(events)
+    client = make_client(tmp_path, fake_client)
+
+    state = client.sync({KEY_1: 0, KEY_2: 0})
+    assert len(fake_client.calls) == 2
+
+    state = client.sync(state)
+    assert len(fake_client.calls) == 2
+
+    events[KEY_2].append(make_event(KEY_2, 0))
+    fake_client.ledger_version = 2
+    state = client.sync(state)
+
+    assert len(fake_client.calls) == 4
+    assert state == {KEY_1: 1, KEY_2: 1}
+
+
+class FakeKeyLeases:
+    replica_id = "pubsub-0"
+
+    def __init__(self, assigned, held):
+        self._assigned = assigned
+        self._held = held
+        self.lost = set()
+        self.released = []
+
+    def heartbeat(self):
+        return ["pubsub-0", "pubsub-1"]
+
+    def assigned(self, keys, replicas):
+        return {key for key in keys if key in self._assigned}
+
+    def acquire(self, keys):
+        return {key for key in keys if key in self._held}
+
+    def holds(self, key):
+        return key not in self.lost
+
+    def release(self, keys):
+        self.released.extend(keys)
+
+
+class SharedProgressStorage:
+    def __init__(self, state):
+        self.state = state
+
+    def fetch_state(self):
+        return self.state.copy()
+
+    def save_state(self, state):
+        self.state.update(state)
+
+
+def test_rebalance_hands_over_keys_with_flushed_progress(tmp_path):
+    client = make_client(tmp_path, FakeDiemClient({}))
+    client.progress = BufferedProgressStorage(
+        SharedProgressStorage({KEY_2: 4}), flush_interval_ms=60_000
+    )
+    client.leases = FakeKeyLeases(assigned={KEY_2}, held={KEY_2})
+
+    client.progress.save_state({KEY_1: 5})
+    client.progress.save_state({KEY_1: 7})
+    assert client.progress.storage.state[KEY_1] == 5
+    state = client.rebalance([KEY_1, KEY_2], {KEY_1: 7})
+
+    assert state == {KEY_2: 4}
+    assert client.leases.released == [KEY_1]
+    assert client.progress.storage.fetch_state() == {KEY_1: 7, KEY_2: 4}
+
+
+def test_keys_of_a_dead_replica_are_taken_over_while_renewing(tmp_path):
+    client = make_client(tmp_path, FakeDiemClient({}))
+    client.progress = BufferedProgressStorage(
+        SharedProgressStorage({KEY_1: 3}), flush_interval_ms=60_000
+    )
+    leases = KeyLeases({"replica_id": "pubsub-0", "lease_ttl_ms": 150})
+    replicas = [[b"pubsub-0", b"pubsub-1"]]
+    leases.redis = MagicMock()
+    leases.redis.pipeline.return_value.execute.side_effect = lambda: [
+        1,
+        0,
+        replicas[0],
+    ]
+    leases.redis.set.return_value = True
+    leases._renew = MagicMock(return_value=1)
+    leases._release = MagicMock()
+    client.leases = leases
+
+    leases.start_renewing()
+    try:
+        state = {}
+        deadline = time.monotonic() + 2
+        while KEY_1 not in state and time.monotonic() < deadline:
+            if leases.rebalance_due():
+                state = client.rebalance([KEY_1, KEY_2], state)
+                # pubsub-1 dies after the first round, KEY_1 is owned by it
+                replicas[0] = [b"pubsub-0"]
+            time.sleep(0.01)
+    finally:
+        leases.stop_renewing()
+
+    assert state == {KEY_1: 3, KEY_2: 0}
+    assert leases.holds(KEY_1)
+
+
+class LeaseLosingDiemClient(FakeDiemClient):
+    """Loses the lease of a key while its events are being fetched"""
+
+    def __init__(self, events_per_key, leases, lost_key):
+        super().__init__(events_per_key)
+        self.leases = leases
+        self.lost_key = lost_key
+
+    def get_events(self, key, start, limit):
+        if key == self.lost_key:
+            self.leases.lost.add(key)
+        return super().get_events(key, start, limit)
+
+
+def test_progress_of_a_key_lost_mid_cycle_is_not_saved(tmp_path):
+    events = {key: [make_event(key, i) for i in range(2)] for key in (KEY_1, KEY_2)}
+    leases = FakeKeyLeases(assigned={KEY_1, KEY_2}, held={KEY_1, KEY_2})
+    client = make_client(tmp_path, LeaseLosingDiemClient(events, leases, KEY_1))
+    storage = SharedProgressStorage({KEY_1: 5})
+    client.progress = BufferedProgressStorage(storage, flush_interval_ms=60_000)
+    client.leases = leases
+
+    client.progress.save_state({KEY_2: 0})
+    # Buffered, not yet written when the lease is lost
+    client.progress.save_state({KEY_1: 1, KEY_2: 0})
+    state = client.sync({KEY_1: 1, KEY_2: 0})
+    client.progress.flush()
+
+    assert state == {KEY_2: 2}
+    # The new owner's progress is not moved back
+    assert storage.state == {KEY_1: 5, KEY_2: 2}
+    assert client.sync(state) == {KEY_2: 2}
+
+
+def test_sync_records_lag_and_event_metrics(tmp_path):
+    events = {KEY_1: [make_event(KEY_1, i) for i in range(3)]}
+    fake_client = FakeDiemClient(events)
+    fake_client.ledger_version = 1100
+    client = make_client(tmp_path, fake_client, sync_strategy_config={"batch_size": 2})
+    labels = {"key": KEY_1}
+    events_before = REGISTRY.get_sample_value("pubsub_events_total", labels) or 0
+
+    state = client.sync({KEY_1: 0})
+    assert REGISTRY.get_sample_value("pubsub_event_key_lag_versions", labels) == 99
+    assert REGISTRY.get_sample_value("pubsub_event_key_sequence", labels) == 2
+
+    client.sync(state)
+    assert REGISTRY.get_sample_value("pubsub_event_key_lag_versions", labels) == 0
+    assert REGISTRY.get_sample_value("pubsub_ledger_version") == 1100
+    assert REGISTRY.get_sample_value("pubsub_events_total", labels) == events_before + 3
+
+
+def test_sync_routes_unmatched_events_aside(tmp_path):
+    class FakeFilter:
+        def refresh(self):
+            pass
+
+        def may_match(self, event):
+            return event.version % 2 == 0
+
+    events = {KEY_1: [make_event(KEY_1, i) for i in range(4)]}
+    client = make_client(
+        tmp_path, FakeDiemClient(events), unmatched_processor=FakeProcessor()
+    )
+    client.subaddress_filter = FakeFilter()
+
+    client.sync({KEY_1: 0})
+
+    assert [e.sequence for e in client.processor.sent] == [0, 2]
+    assert [e.sequence for e in client.unmatched_processor.sent] == [1, 3]
+
+
+def test_sync_sends_events_in_batches(tmp_path):
+    events = {KEY_1: [make_event(KEY_1, i) for i in range(5)]}
+    client = make_client(
+        tmp_path,
+        FakeDiemClient(events),
+        processor_batch_size=2,
+        batch_processor=FakeProcessor(),
+    )
+
+    client.sync({KEY_1: 0})
+
+    batches = client.batch_processor.sent
+    assert [[e.sequence for e in batch] for batch in batches] == [[0, 1], [2, 3], [4]]
+    assert client.processor.sent == []
+
+
+def test_sync_routes_events_to_payment_queues(tmp_path):
+    broker = StubBroker()
+    for queue_name in ("incoming_txn_0", "incoming_txn_1"):
+        broker.declare_queue(queue_name)
+
+    @dramatiq.actor(broker=broker)
+    def processor(txn):
+        pass
+
+    events = [make_event(KEY_1, i) for i in range(5)]
+    for event in events:
+        event.data.metadata = txnmetadata.general_metadata(
+            to_subaddress=bytes([event.sequence_number % 2]) * 8
+        ).hex()
+    client = make_client(
+        tmp_path,
+        FakeDiemClient({KEY_1: events}),
+        processor=processor,
+        payment_queue_name=lambda sub_address: f"incoming_txn_{sub_address[-1]}",
+    )
+
+    client.sync({KEY_1: 0})
+
+    assert broker.queues["incoming_txn_0"].qsize() == 3
+    assert broker.queues["incoming_txn_1"].qsize() == 2
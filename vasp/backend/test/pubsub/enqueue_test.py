@@ -0,0 +1,41 @@
+from unittest.mock import MagicMock
+
+import dramatiq
+from dramatiq.brokers.redis import RedisBroker
+
+from pubsub.enqueue import send_batch
+
+
+def test_send_batch_pipelines_redis_enqueue():
+    redis_client = MagicMock()
+    pipeline = redis_client.pipeline.return_value
+    broker = RedisBroker(client=redis_client, middleware=[], namespace="lrm")
+    processor = dramatiq.actor(lambda txn: None, actor_name="proc", broker=broker)
+
+    send_batch(processor, ["a", "b", "c"])
+
+    redis_client.pipeline.assert_called_once_with(transaction=True)
+    assert pipeline.hset.call_count == 3
+    assert [c.args[0] for c in pipeline.rpush.call_args_list] == ["lrm:default"] * 3
+    pipeline.execute.assert_called_once()
+
+
+def test_send_batch_falls_back_to_send():
+    processor = MagicMock()
+
+    send_batch(processor, ["a", "b"])
+    send_batch(processor, [])
+
+    assert [c.args for c in processor.send.call_args_list] == [("a",), ("b",)]
+
+
+def test_send_batch_to_other_queue():
+    redis_client = MagicMock()
+    pipeline = redis_client.pipeline.return_value
+    broker = RedisBroker(client=redis_client, middleware=[], namespace="lrm")
+    processor = dramatiq.actor(lambda txn: None, actor_name="proc", broker=broker)
+
+    send_batch(processor, ["a"], "incoming_txn_3")
+
+    assert pipeline.rpush.call_args[0][0] == "lrm:incoming_txn_3"
+    assert pipeline.hset.call_args[0][0] == "lrm:incoming_txn_3.msgs"
@@ -0,0 +1,68 @@
+from pubsub.progress import (
+    BufferedProgressStorage,
+    FileProgressStorage,
+    SqlProgressStorage,
+)
+
+
+class CountingProgressStorage:
+    def __init__(self):
+        self.state = {}
+        self.writes = 0
+
+    def fetch_state(self):
+        return self.state.copy()
+
+    def save_state(self, state):
+        self.state = state.copy()
+        self.writes += 1
+
+
+def test_file_progress_storage_roundtrip(tmp_path):
+    storage = FileProgressStorage(str(tmp_path / "progress"))
+    assert storage.fetch_state() == {}
+
+    storage.save_state({"key": 3})
+    storage.save_state({"key": 5})
+
+    assert storage.fetch_state() == {"key": 5}
+    assert not (tmp_path / "progress.tmp").exists()
+
+
+def test_sql_progress_storage_roundtrip(db):
+    storage = SqlProgressStorage()
+    assert storage.fetch_state() == {}
+
+    storage.save_state({"key_1": 3, "key_2": 0})
+    storage.save_state({"key_1": 5, "key_2": 0})
+
+    assert storage.fetch_state() == {"key_1": 5, "key_2": 0}
+
+
+def test_buffered_progress_storage_coalesces_writes():
+    backend = CountingProgressStorage()
+    storage = BufferedProgressStorage(backend, flush_interval_ms=60_000)
+    storage.fetch_state()
+
+    storage.save_state({"key": 1})
+    storage.save_state({"key": 2})
+    storage.save_state({"key": 3})
+    assert backend.writes == 1
+    assert backend.state == {"key": 1}
+
+    storage.flush()
+    storage.flush()
+    assert backend.writes == 2
+    assert backend.state == {"key": 3}
+
+
+def test_buffered_progress_storage_skips_unchanged_state():
+    backend = CountingProgressStorage()
+    backend.state = {"key": 1}
+    storage = BufferedProgressStorage(backend, flush_interval_ms=0)
+    storage.fetch_state()
+
+    storage.save_state({"key": 1})
+    storage.save_state({"key": 1})
+
+    assert backend.writes == 0
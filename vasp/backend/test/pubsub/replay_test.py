@@ -0,0 +1,64 @@
+import dramatiq
+from diem import txnmetadata
+from dramatiq.brokers.stub import StubBroker
+
+from pubsub.replay import replay
+from test.pubsub.client_test import (
+    KEY_1,
+    FakeDiemClient,
+    FakeProcessor,
+    make_event,
+)
+
+
+def test_replay_sends_range_in_order():
+    fake_client = FakeDiemClient({KEY_1: [make_event(KEY_1, i) for i in range(50)]})
+    processor = FakeProcessor()
+
+    sent = replay(fake_client, processor, KEY_1, 5, 27, workers=3, batch_size=4)
+
+    assert sent == 23
+    assert [e.sequence for e in processor.sent] == list(range(5, 28))
+    assert all(limit <= 4 for _, _, limit in fake_client.calls)
+
+
+def test_replay_stops_at_chain_head():
+    fake_client = FakeDiemClient({KEY_1: [make_event(KEY_1, i) for i in range(10)]})
+    processor = FakeProcessor()
+
+    sent = replay(fake_client, processor, KEY_1, 0, 1000, workers=2, batch_size=4)
+
+    assert sent == 10
+    assert [e.sequence for e in processor.sent] == list(range(10))
+    assert len(fake_client.calls) < 10
+
+
+def test_replay_routes_events_to_payment_queues():
+    broker = StubBroker()
+    for queue_name in ("incoming_txn_0", "incoming_txn_1"):
+        broker.declare_queue(queue_name)
+
+    @dramatiq.actor(broker=broker)
+    def processor(txn):
+        pass
+
+    events = [make_event(KEY_1, i) for i in range(5)]
+    for event in events:
+        event.data.metadata = txnmetadata.general_metadata(
+            to_subaddress=bytes([event.sequence_number % 2]) * 8
+        ).hex()
+
+    sent = replay(
+        FakeDiemClient({KEY_1: events}),
+        processor,
+        KEY_1,
+        0,
+        4,
+        batch_size=2,
+        payment_queue_name=lambda sub_address: f"incoming_txn_{sub_address[-1]}",
+    )
+
+    assert sent == 5
+    assert broker.queues["incoming_txn_0"].qsize() == 3
+    assert broker.queues["incoming_txn_1"].qsize() == 2
+    assert broker.queues[processor.queue_name].qsize() == 0
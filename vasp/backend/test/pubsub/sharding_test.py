@@ -0,0 +1,43 @@
+from unittest.mock import MagicMock
+
+from pubsub.sharding import KeyLeases, owner_of
+
+KEYS = [f"{i:048x}" for i in range(200)]
+
+
+def test_every_key_has_exactly_one_owner():
+    replicas = ["pubsub-0", "pubsub-1", "pubsub-2"]
+
+    owners = {key: owner_of(key, replicas) for key in KEYS}
+
+    assert set(owners.values()) == set(replicas)
+    assert owners == {key: owner_of(key, reversed(replicas)) for key in KEYS}
+
+
+def test_only_keys_of_a_dead_replica_move():
+    replicas = ["pubsub-0", "pubsub-1", "pubsub-2"]
+    before = {key: owner_of(key, replicas) for key in KEYS}
+
+    after = {key: owner_of(key, ["pubsub-0", "pubsub-2"]) for key in KEYS}
+
+    moved = [key for key in KEYS if before[key] != after[key]]
+    assert moved
+    assert all(before[key] == "pubsub-1" for key in moved)
+
+
+def test_no_replicas_no_owner():
+    assert owner_of(KEYS[0], []) is None
+
+
+def test_leases_not_renewed_are_no_longer_held():
+    leases = KeyLeases({"replica_id": "pubsub-0", "lease_ttl_ms": 60_000})
+    leases.redis = MagicMock()
+    leases.redis.set.return_value = True
+    leases._renew = MagicMock(side_effect=[1, 0])
+
+    assert leases.acquire(KEYS[:2]) == set(KEYS[:2])
+    leases.renew()
+
+    assert leases.holds(KEYS[0])
+    assert not leases.holds(KEYS[1])
+    assert not leases.holds(KEYS[2])
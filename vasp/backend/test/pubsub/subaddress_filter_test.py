@@ -0,0 +1,75 @@
+from datetime import datetime, timedelta
+
+from diem import txnmetadata
+
+from merchant_vasp.storage import Payment
+from pubsub.subaddress_filter import OpenPaymentFilter
+from pubsub.types import LRWPubSubEvent
+from test.conftest import (
+    CLEARED_PAYMENT_SUBADDR,
+    EXPIRED_PAYMENT_SUBADDR,
+    FAKE_WALLET_VASP_ADDR,
+    PAYMENT_AMOUNT,
+    PAYMENT_CURRENCY,
+    PAYMENT_ID,
+    PAYMENT_SUBADDR,
+    REJECTED_PAYMENT_SUBADDR,
+    SENDER_MOCK_ADDR,
+    SENDER_MOCK_SUBADDR,
+)
+
+
+def make_lrw_event(receiver_sub_address):
+    return LRWPubSubEvent(
+        sender=SENDER_MOCK_ADDR,
+        receiver=FAKE_WALLET_VASP_ADDR,
+        amount=PAYMENT_AMOUNT,
+        currency=PAYMENT_CURRENCY,
+        metadata=txnmetadata.general_metadata(
+            from_subaddress=bytes.fromhex(SENDER_MOCK_SUBADDR),
+            to_subaddress=bytes.fromhex(receiver_sub_address),
+        ),
+        version=1,
+        sequence=0,
+    )
+
+
+def test_event_decodes_subaddresses():
+    event = make_lrw_event(PAYMENT_SUBADDR)
+
+    assert event.receiver_sub_address == PAYMENT_SUBADDR
+    assert event.sender_sub_address == SENDER_MOCK_SUBADDR
+
+
+def test_filter_matches_only_open_payments(db):
+    payment_filter = OpenPaymentFilter({})
+    assert payment_filter.may_match(make_lrw_event(REJECTED_PAYMENT_SUBADDR))
+
+    payment_filter.refresh()
+
+    assert payment_filter.may_match(make_lrw_event(PAYMENT_SUBADDR))
+    assert payment_filter.may_match(make_lrw_event(EXPIRED_PAYMENT_SUBADDR))
+    assert not payment_filter.may_match(make_lrw_event(REJECTED_PAYMENT_SUBADDR))
+    assert not payment_filter.may_match(make_lrw_event(CLEARED_PAYMENT_SUBADDR))
+
+
+def test_filter_picks_up_new_payments_incrementally(db):
+    payment_filter = OpenPaymentFilter({"full_reload_interval_ms": 60_000})
+    payment_filter.refresh()
+    new_subaddress = "1234567812345678"
+
+    payment = Payment.query.get(PAYMENT_ID)
+    Payment.add_payment(
+        Payment(
+            merchant_id=payment.merchant_id,
+            merchant_reference_id="new",
+            requested_amount=1,
+            requested_currency="USD",
+            subaddress=new_subaddress,
+            expiry_date=datetime.utcnow() + timedelta(minutes=10),
+        )
+    )
+    payment_filter.refresh()
+
+    assert payment_filter.may_match(make_lrw_event(new_subaddress))
+    assert payment_filter.may_match(make_lrw_event(PAYMENT_SUBADDR))
@@ -0,0 +1,58 @@
+import pickle
+
+from diem import diem_types
+
+from pubsub.types import LRWPubSubEvent
+from test.conftest import PAYMENT_SUBADDR, SENDER_MOCK_SUBADDR
+from test.pubsub.subaddress_filter_test import make_lrw_event
+
+
+def test_event_pickles_as_compact_wire_format():
+    event = make_lrw_event(PAYMENT_SUBADDR)
+    event.metadata  # decoded state must not travel
+
+    data = pickle.dumps(event)
+    restored = pickle.loads(data)
+
+    assert restored._metadata is None
+    assert restored.to_bytes() == event.to_bytes()
+    assert restored.receiver_sub_address == PAYMENT_SUBADDR
+    assert restored.sender_sub_address == SENDER_MOCK_SUBADDR
+    legacy_state = {name: getattr(event, name) for name in LRWPubSubEvent.__slots__[:6]}
+    legacy_state["metadata"] = event.metadata
+    assert len(data) < len(pickle.dumps(legacy_state))
+
+
+def test_event_decodes_metadata_lazily():
+    event = make_lrw_event(PAYMENT_SUBADDR)
+    assert event._metadata is None
+
+    assert isinstance(event.metadata, diem_types.Metadata__GeneralMetadata)
+
+
+def test_event_with_bad_metadata_is_undefined():
+    event = LRWPubSubEvent.from_bytes(make_lrw_event(PAYMENT_SUBADDR).to_bytes())
+    event.raw_metadata = b"\xff"
+
+    assert isinstance(event.metadata, diem_types.Metadata__Undefined)
+    assert event.receiver_sub_address is None
+
+
+def test_event_restores_pre_wire_format_state():
+    metadata = make_lrw_event(PAYMENT_SUBADDR).metadata
+    event = LRWPubSubEvent.__new__(LRWPubSubEvent)
+
+    event.__setstate__(
+        {
+            "sender": "a",
+            "receiver": "b",
+            "amount": 1,
+            "currency": "XUS",
+            "version": 2,
+            "sequence": 3,
+            "metadata": metadata,
+        }
+    )
+
+    assert event.receiver_sub_address == PAYMENT_SUBADDR
+    assert LRWPubSubEvent.from_bytes(event.to_bytes()).sequence == 3
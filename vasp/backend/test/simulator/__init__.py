@@ -0,0 +1,11 @@
+# Copyright (c) The Diem Core Contributors
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Local stand-in for a Diem full node, for exercising pubsub and the payment
+worker without a testnet. Run it standalone with `python -m test.simulator`.
+"""
+
+from .generator import EventGenerator
+from .ledger import Ledger, RpcError
+from .server import SimulatorServer
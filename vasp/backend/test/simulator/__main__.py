@@ -0,0 +1,63 @@
+# Copyright (c) The Diem Core Contributors
+# SPDX-License-Identifier: Apache-2.0
+
+import argparse
+import time
+
+from . import EventGenerator, Ledger, SimulatorServer
+
+parser = argparse.ArgumentParser(
+    description="Local Diem JSON-RPC simulator paying a receiving account"
+)
+parser.add_argument("--host", type=str, default="127.0.0.1")
+parser.add_argument("--port", type=int, default=8080)
+parser.add_argument(
+    "--receiver", type=str, required=True, help="account receiving the payments"
+)
+parser.add_argument(
+    "--account",
+    type=str,
+    action="append",
+    default=[],
+    help="account to create with funds, e.g. the merchant wallet; repeatable",
+)
+parser.add_argument("--rate", type=float, default=10, help="payments per second")
+parser.add_argument("--min-amount", type=int, default=1_000_000)
+parser.add_argument("--max-amount", type=int, default=100_000_000)
+parser.add_argument("--currency", type=str, default="XUS")
+parser.add_argument(
+    "--subaddress",
+    type=str,
+    action="append",
+    default=[],
+    help="subaddress to pay with --match-ratio probability; repeatable",
+)
+parser.add_argument("--match-ratio", type=float, default=0.0)
+parser.add_argument("--no-metadata-ratio", type=float, default=0.0)
+parser.add_argument("--seed", type=int, default=None)
+args = parser.parse_args()
+
+ledger = Ledger()
+for address in args.account:
+    ledger.create_account(address, {args.currency: 2**62})
+generator = EventGenerator(
+    ledger,
+    args.receiver,
+    rate=args.rate,
+    amounts=(args.min_amount, args.max_amount),
+    currency=args.currency,
+    subaddresses=args.subaddress,
+    match_ratio=args.match_ratio,
+    no_metadata_ratio=args.no_metadata_ratio,
+    seed=args.seed,
+)
+
+with SimulatorServer(ledger, args.host, args.port) as server:
+    print(f"Serving Diem JSON-RPC on {server.url}")
+    generator.start()
+    try:
+        while True:
+            time.sleep(10)
+            print(f"ledger version {ledger.version}")
+    except KeyboardInterrupt:
+        generator.stop()
@@ -0,0 +1,108 @@
+# Copyright (c) The Diem Core Contributors
+# SPDX-License-Identifier: Apache-2.0
+
+import random
+import secrets
+import threading
+import time
+from typing import List, Optional, Sequence, Tuple
+
+from diem import identifier, txnmetadata
+
+from .ledger import Ledger
+
+
+class EventGenerator:
+    """
+    Pays a receiving account from a pool of funded sender accounts, either
+    on demand or at a steady rate from a background thread.
+
+    Each payment goes to one of the given subaddresses with probability
+    match_ratio (e.g. subaddresses of open payments), carries no metadata
+    with probability no_metadata_ratio, and goes to a fresh random
+    subaddress otherwise.
+    """
+
+    def __init__(
+        self,
+        ledger: Ledger,
+        receiver: str,
+        rate: float = 10.0,
+        amounts: Tuple[int, int] = (1_000_000, 100_000_000),
+        currency: str = "XUS",
+        subaddresses: Sequence[str] = (),
+        match_ratio: float = 0.0,
+        no_metadata_ratio: float = 0.0,
+        senders: int = 10,
+        seed: Optional[int] = None,
+    ) -> None:
+        self.ledger = ledger
+        self.receiver = receiver
+        self.rate = rate
+        self.amounts = amounts
+        self.currency = currency
+        self.subaddresses = list(subaddresses)
+        self.match_ratio = match_ratio
+        self.no_metadata_ratio = no_metadata_ratio
+        self.random = random.Random(seed)
+
+        ledger.create_account(receiver)
+        self.senders = [
+            ledger.create_account(
+                "%032x" % self.random.getrandbits(128), {currency: 2**62}
+            ).address
+            for _ in range(senders)
+        ]
+
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def generate(self, count: int = 1) -> List[int]:
+        """Send count payments right away, returning their versions"""
+        return [self._send_payment() for _ in range(count)]
+
+    def start(self) -> None:
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        started = time.monotonic()
+        sent = 0
+        while not self._stop.is_set():
+            # Catch up on the schedule rather than drift when sending is slow
+            due = int((time.monotonic() - started) * self.rate) - sent
+            for _ in range(due):
+                self._send_payment()
+            sent += due
+            self._stop.wait(1 / self.rate)
+
+    def _send_payment(self) -> int:
+        return self.ledger.transfer(
+            self.random.choice(self.senders),
+            self.receiver,
+            self.random.randint(*self.amounts),
+            self.currency,
+            self._metadata(),
+        )
+
+    def _metadata(self) -> bytes:
+        draw = self.random.random()
+        if draw < self.no_metadata_ratio:
+            return b""
+        if self.subaddresses and draw < self.no_metadata_ratio + self.match_ratio:
+            to_subaddress = bytes.fromhex(self.random.choice(self.subaddresses))
+        else:
+            to_subaddress = self.random.getrandbits(
+                8 * identifier.DIEM_SUBADDRESS_SIZE
+            ).to_bytes(identifier.DIEM_SUBADDRESS_SIZE, "big")
+        return txnmetadata.general_metadata(
+            from_subaddress=secrets.token_bytes(identifier.DIEM_SUBADDRESS_SIZE),
+            to_subaddress=to_subaddress,
+        )
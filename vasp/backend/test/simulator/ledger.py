@@ -0,0 +1,318 @@
+# Copyright (c) The Diem Core Contributors
+# SPDX-License-Identifier: Apache-2.0
+
+import hashlib
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from diem import diem_types, stdlib, testnet, utils
+
+DEFAULT_CURRENCIES = {"XUS": 1_000_000}
+
+# Event keys are a creation number (u64, little endian) followed by the address
+RECEIVED_EVENTS_KEY_PREFIX = "0000000000000000"
+SENT_EVENTS_KEY_PREFIX = "0100000000000000"
+
+
+class RpcError(Exception):
+    """An error returned to the caller as a JSON-RPC error object"""
+
+    def __init__(self, code: int, message: str) -> None:
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+@dataclass
+class SimAccount:
+    address: str
+    balances: Dict[str, int] = field(default_factory=dict)
+    sequence_number: int = 0
+    # Version of each transaction sent by the account, by sequence number
+    transactions: List[int] = field(default_factory=list)
+
+    @property
+    def received_events_key(self) -> str:
+        return RECEIVED_EVENTS_KEY_PREFIX + self.address
+
+    @property
+    def sent_events_key(self) -> str:
+        return SENT_EVENTS_KEY_PREFIX + self.address
+
+
+class Ledger:
+    """
+    In-memory stand-in for the Diem ledger, enough to drive pubsub and the
+    payment worker: accounts with balances, peer to peer transfers with
+    their payment events, and transactions by version.
+    Every method returns results in the JSON-RPC wire format.
+    """
+
+    def __init__(
+        self,
+        chain_id: int = testnet.CHAIN_ID.to_int(),
+        currencies: Optional[Dict[str, int]] = None,
+    ) -> None:
+        self.chain_id = chain_id
+        self.currencies = currencies or DEFAULT_CURRENCIES
+        self.accounts: Dict[str, SimAccount] = {}
+        self.events: Dict[str, List[Dict[str, Any]]] = {}
+        self.timestamp_usecs = int(time.time() * 1_000_000)
+        self.transactions: List[Dict[str, Any]] = [self._genesis()]
+        self._lock = threading.RLock()
+
+    @property
+    def version(self) -> int:
+        return len(self.transactions) - 1
+
+    def create_account(
+        self, address: str, balances: Optional[Dict[str, int]] = None
+    ) -> SimAccount:
+        with self._lock:
+            address = utils.account_address_hex(address)
+            account = self.accounts.get(address)
+            if account is None:
+                account = SimAccount(address)
+                self.accounts[address] = account
+                self.events[account.received_events_key] = []
+                self.events[account.sent_events_key] = []
+            for currency, amount in (balances or {}).items():
+                account.balances[currency] = account.balances.get(currency, 0) + amount
+            return account
+
+    def transfer(
+        self,
+        sender: str,
+        receiver: str,
+        amount: int,
+        currency: str,
+        metadata: bytes = b"",
+        signed_txn: Optional[diem_types.SignedTransaction] = None,
+    ) -> int:
+        """
+        Move funds and emit sent and received payment events. Unknown
+        receivers are created on the fly. Returns the transaction version.
+        """
+        with self._lock:
+            payer = self.accounts.get(utils.account_address_hex(sender))
+            if payer is None:
+                raise RpcError(
+                    -32001, f"VM validation error: sender {sender} not found"
+                )
+            if payer.balances.get(currency, 0) < amount:
+                raise RpcError(
+                    -32001,
+                    "VM validation error: INSUFFICIENT_BALANCE_FOR_TRANSACTION_FEE",
+                )
+            payee = self.create_account(receiver)
+
+            payer.balances[currency] -= amount
+            payee.balances[currency] = payee.balances.get(currency, 0) + amount
+
+            version = len(self.transactions)
+            data = {
+                "amount": {"amount": amount, "currency": currency},
+                "sender": payer.address,
+                "receiver": payee.address,
+                "metadata": metadata.hex(),
+            }
+            events = [
+                self._emit(payer.sent_events_key, version, "sentpayment", data),
+                self._emit(payee.received_events_key, version, "receivedpayment", data),
+            ]
+            script = {
+                "type": "peer_to_peer_with_metadata",
+                "receiver": payee.address,
+                "amount": amount,
+                "currency": currency,
+                "metadata": metadata.hex(),
+                "metadata_signature": "",
+            }
+            self._append_user_transaction(payer, script, events, signed_txn)
+            return version
+
+    def submit(self, signed_txn_hex: str) -> None:
+        with self._lock:
+            try:
+                txn = diem_types.SignedTransaction.bcs_deserialize(
+                    bytes.fromhex(signed_txn_hex)
+                )
+            except Exception as e:
+                raise RpcError(-32602, f"Invalid signed transaction: {e}")
+
+            raw_txn = txn.raw_txn
+            sender = utils.account_address_hex(raw_txn.sender)
+            account = self.accounts.get(sender)
+            if account is None:
+                raise RpcError(
+                    -32001, f"VM validation error: sender {sender} not found"
+                )
+            if raw_txn.sequence_number != account.sequence_number:
+                raise RpcError(-32001, "VM validation error: SEQUENCE_NUMBER_TOO_OLD")
+
+            script_call = None
+            if isinstance(raw_txn.payload, diem_types.TransactionPayload__Script):
+                try:
+                    script_call = stdlib.decode_script(raw_txn.payload.value)
+                except ValueError:
+                    pass
+
+            if isinstance(script_call, stdlib.ScriptCall__PeerToPeerWithMetadata):
+                self.transfer(
+                    sender,
+                    utils.account_address_hex(script_call.payee),
+                    int(script_call.amount),
+                    utils.type_tag_to_str(script_call.currency),
+                    script_call.metadata,
+                    signed_txn=txn,
+                )
+            else:
+                # Anything else, like adding a currency, executes with no effect
+                self._append_user_transaction(account, {"type": "unknown"}, [], txn)
+
+    def get_metadata(self, version: Optional[int] = None) -> Dict[str, Any]:
+        with self._lock:
+            version = self.version if version is None else version
+            if version < 0 or version > self.version:
+                raise RpcError(-32602, f"Invalid version {version}")
+            return {
+                "version": version,
+                "timestamp": self.transactions[version]["transaction"][
+                    "timestamp_usecs"
+                ],
+                "chain_id": self.chain_id,
+            }
+
+    def get_account(self, address: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            account = self.accounts.get(utils.account_address_hex(address))
+            if account is None:
+                return None
+            return {
+                "address": account.address,
+                "balances": [
+                    {"amount": amount, "currency": currency}
+                    for currency, amount in account.balances.items()
+                ],
+                "sequence_number": account.sequence_number,
+                "authentication_key": "",
+                "sent_events_key": account.sent_events_key,
+                "received_events_key": account.received_events_key,
+                "delegated_key_rotation_capability": False,
+                "delegated_withdrawal_capability": False,
+                "is_frozen": False,
+                "role": {"type": "unknown"},
+            }
+
+    def get_currencies(self) -> List[Dict[str, Any]]:
+        return [
+            {
+                "code": code,
+                "scaling_factor": scaling_factor,
+                "fractional_part": 100,
+                "to_xdx_exchange_rate": 1.0,
+                "mint_events_key": "",
+                "burn_events_key": "",
+                "preburn_events_key": "",
+                "cancel_burn_events_key": "",
+                "exchange_rate_update_events_key": "",
+            }
+            for code, scaling_factor in self.currencies.items()
+        ]
+
+    def get_events(self, key: str, start: int, limit: int) -> List[Dict[str, Any]]:
+        with self._lock:
+            return self.events.get(key, [])[start : start + limit]
+
+    def get_transactions(
+        self, start_version: int, limit: int, include_events: bool
+    ) -> List[Dict[str, Any]]:
+        with self._lock:
+            transactions = self.transactions[start_version : start_version + limit]
+            return [self._transaction_result(t, include_events) for t in transactions]
+
+    def get_account_transaction(
+        self, address: str, sequence_number: int, include_events: bool
+    ) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            account = self.accounts.get(utils.account_address_hex(address))
+            if account is None or sequence_number >= len(account.transactions):
+                return None
+            version = account.transactions[sequence_number]
+            return self._transaction_result(self.transactions[version], include_events)
+
+    def _next_timestamp(self) -> int:
+        self.timestamp_usecs = max(
+            self.timestamp_usecs + 1, int(time.time() * 1_000_000)
+        )
+        return self.timestamp_usecs
+
+    def _genesis(self) -> Dict[str, Any]:
+        return {
+            "version": 0,
+            "transaction": {
+                "type": "writeset",
+                "timestamp_usecs": self.timestamp_usecs,
+            },
+            "hash": "00" * 32,
+            "events": [],
+            "vm_status": {"type": "executed"},
+            "gas_used": 0,
+        }
+
+    def _emit(
+        self, key: str, version: int, event_type: str, data: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        event = {
+            "key": key,
+            "sequence_number": len(self.events[key]),
+            "transaction_version": version,
+            "data": {"type": event_type, **data},
+        }
+        self.events[key].append(event)
+        return event
+
+    def _append_user_transaction(
+        self,
+        account: SimAccount,
+        script: Dict[str, Any],
+        events: List[Dict[str, Any]],
+        signed_txn: Optional[diem_types.SignedTransaction],
+    ) -> None:
+        version = len(self.transactions)
+        if signed_txn is not None:
+            txn_hash = utils.transaction_hash(signed_txn)
+        else:
+            txn_hash = hashlib.sha3_256(
+                f"{account.address}:{account.sequence_number}".encode()
+            ).hexdigest()
+        self.transactions.append(
+            {
+                "version": version,
+                "transaction": {
+                    "type": "user",
+                    "timestamp_usecs": self._next_timestamp(),
+                    "sender": account.address,
+                    "sequence_number": account.sequence_number,
+                    "chain_id": self.chain_id,
+                    "script": script,
+                },
+                "hash": txn_hash,
+                "events": events,
+                "vm_status": {"type": "executed"},
+                "gas_used": 0,
+            }
+        )
+        account.transactions.append(version)
+        account.sequence_number += 1
+
+    @staticmethod
+    def _transaction_result(
+        transaction: Dict[str, Any], include_events: bool
+    ) -> Dict[str, Any]:
+        result = {**transaction}
+        if not include_events:
+            result["events"] = []
+        return result
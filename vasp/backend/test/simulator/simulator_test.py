@@ -0,0 +1,92 @@
+import pytest
+from diem import jsonrpc, utils
+from diem_utils.types.currencies import DiemCurrency
+
+from merchant_vasp.onchainwallet import OnchainWallet
+from pubsub.batch_rpc import BatchClient
+from pubsub.client import LRWPubSubClient
+from pubsub.types import LRWPubSubEvent
+from test.conftest import FAKE_WALLET_VASP_ADDR, PAYMENT_SUBADDR
+from test.pubsub.client_test import FakeProcessor
+from test.simulator import EventGenerator, Ledger, SimulatorServer
+
+
+@pytest.fixture
+def ledger():
+    return Ledger()
+
+
+@pytest.fixture
+def server(ledger):
+    with SimulatorServer(ledger) as server:
+        yield server
+
+
+def test_generated_payments_are_served_as_events(ledger, server):
+    generator = EventGenerator(
+        ledger,
+        FAKE_WALLET_VASP_ADDR,
+        subaddresses=[PAYMENT_SUBADDR],
+        match_ratio=0.5,
+        seed=1,
+    )
+    versions = generator.generate(20)
+    client = jsonrpc.Client(server.url)
+
+    account = client.get_account(FAKE_WALLET_VASP_ADDR)
+    events = client.get_events(account.received_events_key, 0, 100)
+
+    assert client.get_metadata().version == versions[-1] == ledger.version
+    assert [e.transaction_version for e in events] == versions
+    receivers = [
+        LRWPubSubEvent.from_jsonrpc_event(e).receiver_sub_address for e in events
+    ]
+    assert 0 < receivers.count(PAYMENT_SUBADDR) < 20
+    assert len(client.get_transactions(1, 100, True)) == 20
+
+
+def test_batch_requests_are_answered_per_call(ledger, server):
+    EventGenerator(ledger, FAKE_WALLET_VASP_ADDR, seed=1).generate(3)
+    key = ledger.accounts[FAKE_WALLET_VASP_ADDR].received_events_key
+
+    pages = BatchClient(server.url).get_events({key: (1, 10), "00" * 24: (0, 10)})
+
+    assert [e.sequence_number for e in pages[key]] == [1, 2]
+    assert pages["00" * 24] == []
+
+
+def test_submitted_transfer_is_waited_for(ledger, server):
+    wallet = OnchainWallet()
+    wallet._diem_client = jsonrpc.Client(server.url)
+    ledger.create_account(wallet.address_str, {"XUS": 10_000_000})
+
+    version, _ = wallet.send_transaction(
+        DiemCurrency.XUS, 1_000_000, FAKE_WALLET_VASP_ADDR, PAYMENT_SUBADDR
+    )
+
+    assert version == ledger.version
+    assert utils.balance(wallet.fetch_account_info(), "XUS") == 9_000_000
+
+
+def test_pubsub_syncs_from_simulator(ledger, server, tmp_path):
+    generator = EventGenerator(ledger, FAKE_WALLET_VASP_ADDR, seed=1)
+    generator.generate(25)
+    client = LRWPubSubClient(
+        {
+            "diem_node_uri": server.url,
+            "sync_interval_ms": 0,
+            "progress_file_path": str(tmp_path / "progress"),
+            "accounts": [FAKE_WALLET_VASP_ADDR],
+            "processor": FakeProcessor(),
+            "batch_rpc": True,
+            "sync_strategy_config": {"batch_size": 10, "max_batch_size": 100},
+        }
+    )
+
+    state = client.init_progress_state()
+    while True:
+        state = client.sync(state)
+        if not client.catching_up:
+            break
+
+    assert len(client.processor.sent) == 25
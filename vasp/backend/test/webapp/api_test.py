@@ -220,6 +220,65 @@ def test_pay_used(client):
     assert HTTPStatus.NOT_FOUND == rv.status_code
 
 
+def qr_url(payment_id, option_index, image_format="png"):
+    option = Payment.query.get(payment_id).payment_options[option_index]
+    return f"/payments/{payment_id}/options/{option.id}/qr.{image_format}"
+
+
+def test_pay_options_link_qr_images(client):
+    rv = client.get(f"/payments/{PAYMENT_ID}")
+
+    options = rv.get_json()["options"]
+    assert [option["qr_png_url"] for option in options] == [
+        qr_url(PAYMENT_ID, 0),
+        qr_url(PAYMENT_ID, 1),
+    ]
+    assert options[0]["qr_svg_url"] == qr_url(PAYMENT_ID, 0, "svg")
+    assert "qr_b64" not in options[0]
+
+
+def test_options_in_one_currency_have_their_own_qr_image(client):
+    first = client.get(qr_url(PAYMENT_ID, 0))
+    second = client.get(qr_url(PAYMENT_ID, 1))
+
+    assert HTTPStatus.OK == first.status_code == second.status_code
+    assert first.get_etag() != second.get_etag()
+    assert first.get_data() != second.get_data()
+
+
+def test_payment_qr_image_is_cacheable(client):
+    url = qr_url(PAYMENT_ID, 0)
+
+    rv = client.get(url)
+    assert HTTPStatus.OK == rv.status_code
+    assert rv.mimetype == "image/png"
+    assert rv.get_data().startswith(b"\x89PNG")
+    assert rv.cache_control.max_age == 365 * 24 * 60 * 60
+    etag, _ = rv.get_etag()
+
+    rv = client.get(url, headers={"If-None-Match": f'"{etag}"'})
+    assert HTTPStatus.NOT_MODIFIED == rv.status_code
+    assert rv.get_data() == b""
+
+    rv = client.get(url.replace("qr.png", "qr.svg"))
+    assert rv.mimetype == "image/svg+xml"
+    assert rv.get_etag()[0] != etag
+
+
+def test_payment_qr_unknown_option(client):
+    # An option of another payment
+    rv = client.get(
+        qr_url(CLEARED_PAYMENT_ID, 0).replace(CLEARED_PAYMENT_ID, PAYMENT_ID)
+    )
+    assert HTTPStatus.NOT_FOUND == rv.status_code
+
+    rv = client.get(f"/payments/{PAYMENT_ID}/options/XUS/qr.png")
+    assert HTTPStatus.NOT_FOUND == rv.status_code
+
+    rv = client.get(qr_url(PAYMENT_ID, 0, "gif"))
+    assert HTTPStatus.NOT_FOUND == rv.status_code
+
+
 def test_payment_log_noauth(client):
     payment = Payment.query.get(CLEARED_PAYMENT_ID)
 
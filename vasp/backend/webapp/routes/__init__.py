@@ -21,6 +21,12 @@ def vasp_routes():
         methods=["GET"],
     )
 
+    vasp.add_url_rule(
+        rule="/payments/<payment_id>/options/<int:option_id>/qr.<any(png, svg):image_format>",
+        view_func=VaspRoutes.PaymentQrView.as_view("payment_qr"),
+        methods=["GET"],
+    )
+
     vasp.add_url_rule(
         rule="/payments/<payment_id>/log",
         view_func=VaspRoutes.PaymentLogView.as_view("payment_log"),
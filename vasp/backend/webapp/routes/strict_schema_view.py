@@ -205,6 +205,16 @@ def path_string_param(name, description):
     }
 
 
+def path_int_param(name, description):
+    return {
+        "name": name,
+        "in": "path",
+        "required": True,
+        "description": description,
+        "schema": {"type": "integer"},
+    }
+
+
 def query_positive_float_param(name, description):
     return {
         "name": name,
@@ -3,7 +3,7 @@ from http import HTTPStatus
 from urllib.parse import urljoin
 
 import werkzeug
-from flask import Blueprint, request, url_for, render_template
+from flask import Blueprint, Response, request, url_for, render_template
 
 from merchant_vasp import transaction_manager
 from merchant_vasp.payment_service import payment_service
@@ -15,6 +15,8 @@ from .strict_schema_view import (
     StrictSchemaView,
     response_definition,
     path_uuid_param,
+    path_string_param,
+    path_int_param,
     body_parameter,
 )
 from ..schemas import (
@@ -151,12 +153,21 @@ class VaspRoutes:
             if not transaction_manager.payment_can_pay(self.payment):
                 raise PaymentNotFound
 
+            options = payment_service.generate_payment_options(self.payment)
+            # Keyed by option, as a payment may offer a currency more than once
+            for payment_option, option in zip(self.payment.payment_options, options):
+                for image_format in ("png", "svg"):
+                    option[f"qr_{image_format}_url"] = url_for(
+                        "vasp.payment_qr",
+                        payment_id=self.payment.id,
+                        option_id=payment_option.id,
+                        image_format=image_format,
+                    )
+
             return (
                 dict(
                     payment_id=self.payment.id,
-                    options=payment_service.generate_payment_options_with_qr(
-                        self.payment
-                    ),
+                    options=options,
                     fiat_price=self.payment.requested_amount,
                     fiat_currency=self.payment.requested_currency,
                     wallet_url=os.getenv("WALLET_URL"),
@@ -166,6 +177,47 @@ class VaspRoutes:
                 HTTPStatus.OK,
             )
 
+    class PaymentQrView(PaymentVaspView):
+        require_merchant = False
+        summary = "Get the QR code of a payment option"
+
+        # The payment link behind an image never changes, so clients and
+        # proxies may keep it as long as they like
+        CACHE_MAX_AGE = 365 * 24 * 60 * 60
+
+        parameters = [
+            path_uuid_param("payment_id", "ID of an existing payment"),
+            path_int_param("option_id", "ID of the payment option"),
+            path_string_param("image_format", "png or svg"),
+        ]
+        responses = {
+            HTTPStatus.OK: {
+                "description": "QR code image",
+                "content": {"image/png": {}, "image/svg+xml": {}},
+            },
+            HTTPStatus.NOT_MODIFIED: {"description": "Cached image is current"},
+            HTTPStatus.NOT_FOUND: response_definition("Unknown payment option"),
+        }
+
+        def get(self, payment_id, option_id, image_format):
+            self._load_payment(payment_id)
+            qr = payment_service.payment_option_qr(
+                self.payment, option_id, image_format
+            )
+            if qr is None:
+                raise PaymentNotFound
+
+            response = Response(mimetype=qr.mimetype)
+            response.set_etag(qr.etag)
+            response.cache_control.public = True
+            response.cache_control.max_age = self.CACHE_MAX_AGE
+            response.cache_control.immutable = True
+            if request.if_none_match.contains(qr.etag):
+                return response, HTTPStatus.NOT_MODIFIED
+
+            response.set_data(qr.render())
+            return response, HTTPStatus.OK
+
     class ListPaymentsView(MerchantVaspView):
         summary = "List payments for merchant"
         responses = {
@@ -141,6 +141,8 @@ class PaymentOptionSchema(Schema):
     currency = diem_currency_code_field(required=True)
     amount = diem_amount_field(required=True)
     payment_link = fields.Str(required=True)
+    qr_png_url = fields.Str(required=True)
+    qr_svg_url = fields.Str(required=True)
 
 
 class PaymentOptionsSchema(Schema):